@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.teams import RoundRobinGroupChat
+from autogen_ext.agents.web_surfer import MultimodalWebSurfer
+
+
+class CachingWebSurfer(MultimodalWebSurfer):
+    """
+    以收到的最後一則文字訊息為鍵，把搜尋結果存進所有團隊共用的 search_cache。
+    其他批次提出相同問題時直接回傳快取結果，不再重新開網頁搜尋；
+    同一個問題正在搜尋時，後來的批次會等待第一個批次的結果。
+    """
+
+    def __init__(self, name, model_client, search_cache: dict, **kwargs):
+        super().__init__(name, model_client, **kwargs)
+        self.search_cache = search_cache
+
+    async def on_messages_stream(self, messages, cancellation_token):
+        texts = [m.content for m in messages if isinstance(m, TextMessage)]
+        key = " ".join(texts[-1].split()) if texts else None
+        if key is None:
+            async for item in super().on_messages_stream(messages, cancellation_token):
+                yield item
+            return
+
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            content = await asyncio.shield(cached)
+            if content is not None:
+                print(f"[{self.name}] 使用共用搜尋快取")
+                yield Response(chat_message=TextMessage(content=content, source=self.name))
+                return
+
+        future = asyncio.get_running_loop().create_future()
+        self.search_cache[key] = future
+        content = None
+        try:
+            async for item in super().on_messages_stream(messages, cancellation_token):
+                if isinstance(item, Response) and isinstance(item.chat_message, TextMessage):
+                    content = item.chat_message.content
+                yield item
+        finally:
+            future.set_result(content)
+            if content is None:
+                # 搜尋失敗或沒有文字結果時不保留快取，讓下一個批次重新搜尋
+                self.search_cache.pop(key, None)
+
+
+class TeamPool:
+    """
+    預先建立 size 組代理人團隊（各自擁有一個網頁瀏覽器），批次處理時借出、用完歸還。
+    歸還時呼叫 team.reset() 清除對話狀態，瀏覽器則保留給下一個批次繼續使用。
+    """
+
+    def __init__(self, model_client, termination_factory, size=4):
+        self.model_client = model_client
+        self.termination_factory = termination_factory
+        self.size = size
+        self.search_cache = {}
+        self._teams = []
+        self._queue = asyncio.Queue()
+
+    def _build_team(self):
+        data_agent = AssistantAgent("data_agent", self.model_client)
+        web_surfer = CachingWebSurfer("web_surfer", self.model_client, self.search_cache)
+        assistant = AssistantAgent("assistant", self.model_client)
+        user_proxy = UserProxyAgent("user_proxy")
+        # 終止條件帶有狀態，每個團隊各用一份
+        team = RoundRobinGroupChat(
+            [data_agent, web_surfer, assistant, user_proxy],
+            termination_condition=self.termination_factory()
+        )
+        return team, web_surfer
+
+    def start(self):
+        for _ in range(self.size):
+            team, web_surfer = self._build_team()
+            self._teams.append((team, web_surfer))
+            self._queue.put_nowait(team)
+
+    @asynccontextmanager
+    async def checkout(self):
+        team = await self._queue.get()
+        try:
+            yield team
+        finally:
+            await team.reset()
+            self._queue.put_nowait(team)
+
+    async def close(self):
+        """關閉所有團隊的瀏覽器。"""
+        for _, web_surfer in self._teams:
+            await web_surfer.close()
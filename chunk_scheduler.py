@@ -0,0 +1,42 @@
+import asyncio
+
+from rate_limit import TokenBucket
+
+
+async def schedule_chunks(chunks, worker, max_in_flight=4, requests_per_minute=None):
+    """
+    從 chunks（可為 pd.read_csv(..., chunksize=...) 的 reader）逐一取出批次，
+    同時最多只有 max_in_flight 個 worker(index, chunk) 在執行，
+    並以 requests_per_minute 限制每分鐘啟動的批次數。
+    以非同步產生器的方式依完成順序回傳結果，
+    因此記憶體中只會保留執行中的批次，不會一次讀入整個檔案。
+    """
+    limiter = TokenBucket(requests_per_minute)
+    iterator = enumerate(chunks)
+    pending = set()
+
+    async def run(index, chunk):
+        await limiter.acquire_async()
+        return await worker(index, chunk)
+
+    def fill():
+        # 補滿執行中的批次，讀取器用完時就不再補
+        while len(pending) < max_in_flight:
+            try:
+                index, chunk = next(iterator)
+            except StopIteration:
+                return
+            pending.add(asyncio.ensure_future(run(index, chunk)))
+
+    fill()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+            fill()
+    finally:
+        # 呼叫端提早結束或發生例外時，取消尚未完成的批次
+        for task in pending:
+            task.cancel()
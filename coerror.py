@@ -0,0 +1,143 @@
+import sys
+import numpy as np
+import pandas as pd
+
+# 答題矩陣 CSV 中非學生作答的欄位
+META_COLUMNS = ["題號", "題型", "單元", "題目", "答案", "錯誤率"]
+
+
+def answer_columns(df: pd.DataFrame):
+    """
+    找出學生作答欄位，回傳 (學生欄位, 轉成數值的作答 DataFrame)。
+    只保留真正為 0/1（可留空）的欄位，其他多出來的資料欄位直接略過，不當成作答。
+    """
+    candidates = [col for col in df.columns if col not in META_COLUMNS]
+    answers = df[candidates].apply(pd.to_numeric, errors="coerce")
+    valid = answers.isin([0, 1]) | answers.isna()
+    # 非數字的文字轉成 NaN 後也會通過上面的檢查，所以另外確認空白數沒有增加
+    student_cols = [
+        col for col in candidates
+        if valid[col].all() and answers[col].notna().any() and answers[col].isna().sum() == df[col].isna().sum()
+    ]
+    return student_cols, answers[student_cols]
+
+
+def load_answer_matrix(csv_file_path: str):
+    """
+    讀取寬格式答題 CSV（每列一題、每位學生一欄，0 表示答錯、1 表示答對）。
+    回傳 (題號, 學生欄位, 作答矩陣)，作答矩陣為 題數 × 學生數 的 float32，
+    缺考或空白以 NaN 表示。
+    """
+    df = pd.read_csv(csv_file_path)
+    student_cols, answers = answer_columns(df)
+    matrix = answers.to_numpy(dtype=np.float32)
+    question_ids = df["題號"].tolist() if "題號" in df.columns else list(range(1, len(df) + 1))
+    return question_ids, student_cols, matrix
+
+
+def co_occurrence_counts(matrix: np.ndarray, block_size: int = 16384):
+    """
+    以學生維度分塊做矩陣乘法，一次走訪整個作答矩陣即可算出每對題目的列聯表：
+      n11 兩題皆對、n10 第 i 題對第 j 題錯、n01 第 i 題錯第 j 題對、n00 兩題皆錯。
+    每塊學生數不超過 block_size，float32 乘積在此範圍內為精確整數，
+    再累加到 float64，因此可處理數十萬名學生。
+    """
+    num_questions, num_students = matrix.shape
+    both_answered = np.zeros((num_questions, num_questions), dtype=np.float64)
+    both_correct = np.zeros((num_questions, num_questions), dtype=np.float64)
+    correct_answered = np.zeros((num_questions, num_questions), dtype=np.float64)
+
+    for start in range(0, num_students, block_size):
+        block = matrix[:, start:start + block_size]
+        answered = (~np.isnan(block)).astype(np.float32)
+        correct = np.nan_to_num(block, nan=0.0)
+        both_answered += answered @ answered.T
+        both_correct += correct @ correct.T
+        # correct_answered[i, j]：第 i 題答對且第 j 題有作答的人數
+        correct_answered += correct @ answered.T
+
+    n11 = both_correct
+    n10 = correct_answered - both_correct
+    n01 = correct_answered.T - both_correct
+    n00 = both_answered - correct_answered - correct_answered.T + both_correct
+    return n11, n10, n01, n00
+
+
+def association_scores(matrix: np.ndarray, block_size: int = 16384) -> dict:
+    """
+    由列聯表計算每對題目的關聯指標（皆為 題數 × 題數 矩陣）：
+      co_error_rate  兩題同時答錯的比例
+      co_correct_rate 兩題同時答對的比例
+      phi            phi 相關係數（二元變數的皮爾森相關）
+      lift           同時答錯的提升度 P(兩題皆錯) / (P(i 錯) * P(j 錯))
+    分母為 0 的位置以 0 表示。
+    """
+    n11, n10, n01, n00 = co_occurrence_counts(matrix, block_size)
+    total = n11 + n10 + n01 + n00
+    wrong_i = n01 + n00
+    wrong_j = n10 + n00
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        co_error_rate = np.where(total > 0, n00 / total, 0.0)
+        co_correct_rate = np.where(total > 0, n11 / total, 0.0)
+        denominator = np.sqrt((n11 + n10) * (n01 + n00) * (n11 + n01) * (n10 + n00))
+        phi = np.where(denominator > 0, (n11 * n00 - n10 * n01) / denominator, 0.0)
+        lift = np.where(wrong_i * wrong_j > 0, n00 * total / (wrong_i * wrong_j), 0.0)
+
+    return {
+        "co_error_count": n00,
+        "n_students": total,
+        "co_error_rate": co_error_rate,
+        "co_correct_rate": co_correct_rate,
+        "phi": phi,
+        "lift": lift,
+    }
+
+
+def rank_question_links(question_ids, scores: dict, top_k: int = 30, min_co_errors: int = 2) -> pd.DataFrame:
+    """
+    取上三角的題目配對，過濾同時答錯人數少於 min_co_errors 的配對，
+    依 phi 由高到低排序後回傳前 top_k 筆題目連結。
+    """
+    rows, cols = np.triu_indices(len(question_ids), k=1)
+    keep = scores["co_error_count"][rows, cols] >= min_co_errors
+    rows, cols = rows[keep], cols[keep]
+
+    phi = scores["phi"][rows, cols]
+    order = np.lexsort((-scores["lift"][rows, cols], -phi))[:top_k]
+    rows, cols = rows[order], cols[order]
+
+    question_ids = np.asarray(question_ids)
+    return pd.DataFrame({
+        "題號_a": question_ids[rows],
+        "題號_b": question_ids[cols],
+        "co_error_rate": scores["co_error_rate"][rows, cols],
+        "co_correct_rate": scores["co_correct_rate"][rows, cols],
+        "phi": scores["phi"][rows, cols],
+        "lift": scores["lift"][rows, cols],
+        "n_students": scores["n_students"][rows, cols].astype(int),
+    })
+
+
+def question_links(csv_file_path: str, top_k: int = 30, min_co_errors: int = 2, block_size: int = 16384) -> pd.DataFrame:
+    """讀取答題 CSV 並回傳排序後的題目錯誤關聯。"""
+    question_ids, _, matrix = load_answer_matrix(csv_file_path)
+    scores = association_scores(matrix, block_size)
+    return rank_question_links(question_ids, scores, top_k, min_co_errors)
+
+
+def format_links(links: pd.DataFrame) -> str:
+    """將題目連結整理成精簡文字，供 LLM 提示使用。"""
+    lines = [
+        f"第{a}題 ↔ 第{b}題：同錯率 {co_error:.2f}，同對率 {co_correct:.2f}，phi {phi:.2f}，lift {lift:.2f}"
+        for a, b, co_error, co_correct, phi, lift in zip(
+            links["題號_a"], links["題號_b"], links["co_error_rate"],
+            links["co_correct_rate"], links["phi"], links["lift"]
+        )
+    ]
+    return "\n".join(lines) if lines else "沒有找到明顯的題目錯誤關聯。"
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "test_01-2.csv"
+    print(format_links(question_links(csv_path)))
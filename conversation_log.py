@@ -0,0 +1,136 @@
+import os
+import csv
+import glob
+from datetime import datetime
+
+# attempt 為寫入該筆紀錄的執行編號，用來分辨中斷後重跑同一批次所留下的紀錄
+LOG_COLUMNS = ["batch_start", "batch_end", "source", "content", "type", "prompt_tokens", "completion_tokens", "attempt"]
+
+# 批次所有訊息都寫入後補上的結束標記，續跑時據此判斷該批次已完整記錄
+BATCH_DONE = "BatchDone"
+
+
+class ConversationLogSink:
+    """
+    逐筆寫入的對話紀錄，每收到一則訊息就立即寫入並 flush，
+    批次中途當掉也不會遺失已收到的訊息。
+      - 副檔名為 .csv 時以附加模式寫入同一個 CSV 檔；
+      - 副檔名為 .arrows 時視為目錄，每次執行寫入一個新的 Arrow IPC 串流檔（需安裝 pyarrow），
+        讀取時合併目錄下所有串流檔。
+    """
+
+    def __init__(self, path="all_conversation_log.csv"):
+        self.path = path
+        # 每次執行一個編號，隨每筆訊息與結束標記一起寫入
+        self.attempt = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}"
+        self.format = "arrow" if path.endswith(".arrows") else "csv"
+        self._file = None
+        self._writer = None
+
+    def _read_existing(self):
+        """讀回既有紀錄（list of dict），檔案不存在時回傳空清單。"""
+        if self.format == "csv":
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, newline="", encoding="utf-8-sig") as f:
+                return list(csv.DictReader(f))
+
+        import pyarrow as pa
+
+        records = []
+        for part in sorted(glob.glob(os.path.join(self.path, "*.arrows"))):
+            with pa.OSFile(part, "rb") as f:
+                try:
+                    for batch in pa.ipc.open_stream(f):
+                        records.extend(batch.to_pylist())
+                except (pa.ArrowInvalid, OSError):
+                    # 上次執行中斷時最後一筆可能只寫了一半，保留前面讀到的部分
+                    pass
+        return records
+
+    @staticmethod
+    def _attempt_key(record):
+        # CSV 讀回的是字串、Arrow 是整數；舊版紀錄沒有 attempt 欄位
+        return str(record["batch_start"]), record.get("attempt") or ""
+
+    def _done_attempts(self, records) -> set:
+        return {self._attempt_key(record) for record in records if record["type"] == BATCH_DONE}
+
+    def read_records(self) -> list:
+        """
+        讀回對話紀錄，只保留有寫入結束標記的那次執行所留下的訊息；
+        中斷的批次在續跑時會重新記錄，中斷前寫入的部分訊息在這裡被濾掉。
+        """
+        records = self._read_existing()
+        done = self._done_attempts(records)
+        return [record for record in records if self._attempt_key(record) in done]
+
+    def completed_batches(self) -> set:
+        """回傳已有結束標記的 batch_start 集合。"""
+        return {int(batch_start) for batch_start, _ in self._done_attempts(self._read_existing())}
+
+    def _upgrade_csv(self):
+        """舊版 CSV 沒有 attempt 欄位時，先補上欄位再繼續附加，避免欄位錯位。"""
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames == LOG_COLUMNS:
+                return
+            records = list(reader)
+        with open(self.path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=LOG_COLUMNS)
+            writer.writeheader()
+            writer.writerows({col: record.get(col) for col in LOG_COLUMNS} for record in records)
+
+    def _open(self):
+        if self.format == "csv":
+            is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            if not is_new:
+                self._upgrade_csv()
+            self._file = open(self.path, "a", newline="", encoding="utf-8-sig")
+            self._writer = csv.DictWriter(self._file, fieldnames=LOG_COLUMNS)
+            if is_new:
+                self._writer.writeheader()
+        else:
+            import pyarrow as pa
+
+            self._schema = pa.schema([
+                ("batch_start", pa.int64()),
+                ("batch_end", pa.int64()),
+                ("source", pa.string()),
+                ("content", pa.string()),
+                ("type", pa.string()),
+                ("prompt_tokens", pa.int64()),
+                ("completion_tokens", pa.int64()),
+                ("attempt", pa.string()),
+            ])
+            os.makedirs(self.path, exist_ok=True)
+            part = os.path.join(self.path, f"part_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.arrows")
+            self._file = pa.OSFile(part, "wb")
+            self._writer = pa.ipc.new_stream(self._file, self._schema)
+
+    def write(self, record: dict):
+        """寫入一則訊息並立即 flush。"""
+        if self._writer is None:
+            self._open()
+        row = {col: record.get(col) for col in LOG_COLUMNS}
+        row["attempt"] = self.attempt
+        if self.format == "csv":
+            self._writer.writerow(row)
+        else:
+            import pyarrow as pa
+
+            self._writer.write_batch(pa.RecordBatch.from_pylist([row], schema=self._schema))
+        self._file.flush()
+
+    def mark_done(self, batch_start, batch_end):
+        """寫入批次結束標記。"""
+        self.write({"batch_start": batch_start, "batch_end": batch_end, "source": "", "content": "", "type": BATCH_DONE})
+
+    def close(self):
+        if self._writer is None:
+            return
+        if self.format == "arrow":
+            self._writer.close()
+        self._file.close()
+        self._file = None
+        self._writer = None
@@ -5,16 +5,91 @@ from dotenv import load_dotenv
 import io
 
 # 根據你的專案結構調整下列 import
-from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.messages import TextMessage
 from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_ext.agents.web_surfer import MultimodalWebSurfer
+
+from coerror import question_links, format_links
+from chunk_scheduler import schedule_chunks
+from conversation_log import ConversationLogSink
+from agent_pool import TeamPool
+from token_budget import estimate_tokens, TokenReport
+from gemini_client import model_name
 
 load_dotenv()
 
-async def process_chunk(chunk, start_idx, total_records, model_client, termination_condition):
+# "links"：先在本機以 NumPy 計算題目錯誤關聯，只把排序後的連結交給代理人；
+# "chunks"：沿用原本逐批把原始資料送給代理人的做法
+ANALYSIS_MODE = os.environ.get("DATA_AGENT_MODE", "links")
+
+# 同時執行的批次上限與每分鐘最多啟動的批次數（0 表示不限）
+MAX_IN_FLIGHT = int(os.environ.get("DATA_AGENT_MAX_IN_FLIGHT", "4"))
+REQUESTS_PER_MINUTE = float(os.environ.get("DATA_AGENT_RPM", "10"))
+
+# 對話紀錄輸出位置；副檔名為 .arrows 時改用 Arrow 欄式格式
+LOG_PATH = os.environ.get("DATA_AGENT_LOG", "all_conversation_log.csv")
+
+# 每批資料的估計 prompt token 上限；批次依預算裝箱，而不是固定筆數
+TOKEN_BUDGET = int(os.environ.get("DATA_AGENT_TOKEN_BUDGET", "100000"))
+# process_chunk 提示中固定說明文字的估計 token 數
+PROMPT_OVERHEAD = 200
+
+# 每批的估計 token 數與模型回報的第一次 prompt_tokens
+token_report = TokenReport()
+
+async def run_team(prompt, batch_start, batch_end, pool, sink, estimate=None):
+    """
+    從團隊池借出一組代理人團隊執行指定提示，每收到一則 TextMessage 就立即寫入 sink，
+    全部完成後寫入批次結束標記，並回傳訊息數量。
+    有提供 estimate 時，與第一則回覆回報的 prompt_tokens 一起記錄到 token_report。
+    """
+    message_count = 0
+    first_prompt_tokens = None
+    async with pool.checkout() as team:
+        async for event in team.run_stream(task=prompt):
+            if isinstance(event, TextMessage):
+                # 印出目前哪個 agent 正在運作，方便追蹤
+                print(f"[{event.source}] => {event.content}\n")
+                sink.write({
+                    "batch_start": batch_start,
+                    "batch_end": batch_end,
+                    "source": event.source,
+                    "content": event.content,
+                    "type": event.type,
+                    "prompt_tokens": event.models_usage.prompt_tokens if event.models_usage else None,
+                    "completion_tokens": event.models_usage.completion_tokens if event.models_usage else None
+                })
+                message_count += 1
+                if first_prompt_tokens is None and event.models_usage:
+                    first_prompt_tokens = event.models_usage.prompt_tokens
+    sink.mark_done(batch_start, batch_end)
+    if estimate is not None:
+        token_report.record(f"批次 {batch_start}-{batch_end}", estimate, first_prompt_tokens)
+    return message_count
+
+def pack_chunks(reader, token_budget, overhead=0):
+    """
+    把 pd.read_csv 讀取器產生的資料重新裝箱：依每列轉成 dict 後的估計 token 數
+    （包含題目等長文字欄位）累加，讓每批不超過 token_budget，
+    產生 (DataFrame, 估計 token 數)。每批保留原本的 index，第一列即為批次起點。
+    """
+    pending = []
+    used = overhead
+    for chunk in reader:
+        costs = [estimate_tokens(record) + 2 for record in chunk.to_dict(orient='records')]
+        start = 0
+        for i, cost in enumerate(costs):
+            if (i > start or pending) and used + cost > token_budget:
+                pending.append(chunk.iloc[start:i])
+                yield pd.concat(pending), used
+                pending, start, used = [], i, overhead
+            used += cost
+        if start < len(chunk):
+            pending.append(chunk.iloc[start:])
+    if pending:
+        yield pd.concat(pending), used
+
+async def process_chunk(chunk, start_idx, total_records, pool, sink, estimate=None):
     """
     處理單一批次資料：
       - 將該批次資料轉成 dict 格式
@@ -23,7 +98,7 @@ async def process_chunk(chunk, start_idx, total_records, model_client, terminati
       - 請 MultimodalWebSurfer 代理人利用外部網站搜尋功能，
         搜尋最新寶寶照護建議資訊（例如餵食、睡眠、尿布更換等），
         並將搜尋結果納入建議中。
-      - 收集所有回覆訊息並返回。
+      - 將所有回覆訊息逐筆寫入對話紀錄。
     """
     # 將資料轉成 dict 格式
     chunk_data = chunk.to_dict(orient='records')
@@ -46,31 +121,22 @@ async def process_chunk(chunk, start_idx, total_records, model_client, terminati
         "請根據所有學生的答題趨勢，做一個錯題預測"
     )
     
-    # 為每個批次建立新的 agent 與 team 實例
-    local_data_agent = AssistantAgent("data_agent", model_client)
-    local_web_surfer = MultimodalWebSurfer("web_surfer", model_client)
-    local_assistant = AssistantAgent("assistant", model_client)
-    local_user_proxy = UserProxyAgent("user_proxy")
-    local_team = RoundRobinGroupChat(
-        [local_data_agent, local_web_surfer, local_assistant, local_user_proxy],
-        termination_condition=termination_condition
+    return await run_team(prompt, start_idx, start_idx + len(chunk) - 1, pool, sink, estimate)
+
+async def process_links(csv_file_path, total_records, pool, sink, top_k=30):
+    """
+    在本機一次算完整份答題矩陣的題目錯誤關聯（同錯率、同對率、phi、lift），
+    只把排序後的題目連結交給代理人做錯題預測，不必再傳送原始資料列。
+    """
+    links = question_links(csv_file_path, top_k=top_k)
+    prompt = (
+        f"以下為全部 {total_records} 題的答題資料在本機計算出的題目錯誤關聯（依 phi 由高到低排序）：\n"
+        f"{format_links(links)}\n\n"
+        "說明：同錯率為兩題同時答錯的學生比例，同對率為兩題同時答對的比例，"
+        "phi 為兩題對錯的相關係數，lift 大於 1 表示兩題同時答錯的機率高於各自獨立的情況。\n"
+        "請根據以上題目連結分析不同題號間的錯誤關聯，並根據所有學生的答題趨勢，做一個錯題預測"
     )
-    
-    messages = []
-    async for event in local_team.run_stream(task=prompt):
-        if isinstance(event, TextMessage):
-            # 印出目前哪個 agent 正在運作，方便追蹤
-            print(f"[{event.source}] => {event.content}\n")
-            messages.append({
-                "batch_start": start_idx,
-                "batch_end": start_idx + len(chunk) - 1,
-                "source": event.source,
-                "content": event.content,
-                "type": event.type,
-                "prompt_tokens": event.models_usage.prompt_tokens if event.models_usage else None,
-                "completion_tokens": event.models_usage.completion_tokens if event.models_usage else None
-            })
-    return messages
+    return await run_team(prompt, 0, total_records - 1, pool, sink)
 
 async def main():
     gemini_api_key = os.environ.get("GEMINI_API_KEY")
@@ -78,41 +144,65 @@ async def main():
         print("請檢查 .env 檔案中的 GEMINI_API_KEY。")
         return
 
-    # 初始化模型用戶端 (此處示範使用 gemini-2.0-flash)
+    # 初始化模型用戶端（模型名稱統一在 gemini_client.MODELS 設定）
     model_client = OpenAIChatCompletionClient(
-        model="gemini-2.0-flash",
+        model=model_name("agent"),
         api_key=gemini_api_key,
     )
     
-    termination_condition = TextMentionTermination("exit")
+    # 預先建立與同時執行批次數相同的團隊，批次間共用瀏覽器與搜尋結果
+    pool = TeamPool(model_client, lambda: TextMentionTermination("exit"), size=max(1, MAX_IN_FLIGHT))
+    pool.start()
     
     # 使用 pandas 以 chunksize 方式讀取 CSV 檔案
     csv_file_path = "test_01-2.csv"
     chunk_size = 1000
-    chunks = list(pd.read_csv(csv_file_path, chunksize=chunk_size))
-    total_records = sum(chunk.shape[0] for chunk in chunks)
-    
-    # 利用 map 與 asyncio.gather 同時處理所有批次（避免使用傳統 for 迴圈）
-    tasks = list(map(
-        lambda idx_chunk: process_chunk(
-            idx_chunk[1],
-            idx_chunk[0] * chunk_size,
-            total_records,
-            model_client,
-            termination_condition
-        ),
-        enumerate(chunks)
-    ))
+    # 只讀第一欄計算總筆數，不把整個檔案留在記憶體中
+    total_records = sum(chunk.shape[0] for chunk in pd.read_csv(csv_file_path, usecols=[0], chunksize=chunk_size))
     
-    results = await asyncio.gather(*tasks)
-    # 將所有批次的訊息平坦化成一個清單
-    all_messages = [msg for batch in results for msg in batch]
+    # 對話紀錄逐筆寫入；已有結束標記的批次代表上次已完整記錄，續跑時直接略過
+    # 中斷批次留下的部分訊息仍在檔案中，讀取時請用 sink.read_records() 只取完整記錄的執行
+    sink = ConversationLogSink(LOG_PATH)
+    completed = sink.completed_batches()
+    if completed:
+        print(f"略過已完成的批次：{sorted(completed)}")
     
-    # 將對話紀錄整理成 DataFrame 並存成 CSV
-    df_log = pd.DataFrame(all_messages)
-    output_file = "all_conversation_log.csv"
-    df_log.to_csv(output_file, index=False, encoding="utf-8-sig")
-    # print(f"已將所有對話紀錄輸出為 {output_file}")
+    try:
+        if ANALYSIS_MODE == "links":
+            # 本機計算題目關聯後只需一次代理人對話
+            if 0 not in completed:
+                await process_links(csv_file_path, total_records, pool, sink)
+        else:
+            # 逐批從讀取器取出資料並依 token 預算重新裝箱，最多同時處理 MAX_IN_FLIGHT 批
+            # 並限制每分鐘啟動的批次數，哪一批先完成就先收集哪一批的結果
+            # （讀取器的 index 會延續，第一列即為批次起點）
+            chunks = (
+                (chunk, estimate)
+                for chunk, estimate in pack_chunks(
+                    pd.read_csv(csv_file_path, chunksize=chunk_size), TOKEN_BUDGET, PROMPT_OVERHEAD
+                )
+                if chunk.index[0] not in completed
+            )
+
+            async def worker(idx, packed):
+                chunk, estimate = packed
+                start_idx = int(chunk.index[0])
+                print(f"批次 {start_idx} 起共 {len(chunk)} 筆，估計 {estimate} tokens")
+                count = await process_chunk(chunk, start_idx, total_records, pool, sink, estimate)
+                return start_idx, start_idx + len(chunk) - 1, count
+
+            async for start_idx, end_idx, count in schedule_chunks(
+                chunks,
+                worker,
+                max_in_flight=MAX_IN_FLIGHT,
+                requests_per_minute=REQUESTS_PER_MINUTE,
+            ):
+                print(f"批次 {start_idx} 至 {end_idx} 完成，共 {count} 則訊息")
+    finally:
+        sink.close()
+        await pool.close()
+    print(token_report.summary())
+    print(f"已將所有對話紀錄輸出為 {LOG_PATH}")
 
 if __name__ == '__main__':
     asyncio.run(main())
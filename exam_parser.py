@@ -0,0 +1,84 @@
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+SECTION_TITLES = ["一、是非題", "二、選擇題", "三、應用題"]
+
+ITEM_PATTERN = re.compile(r"^\d+\.")
+
+# kind 為 section（大題標題）、item（編號題目）、text（故事、選項或其他文字）、blank（空行），
+# 正好是排版時需要區分的幾種行
+ExamLine = namedtuple("ExamLine", ["kind", "text"])
+
+
+def classify_line(line: str) -> ExamLine:
+    stripped = line.strip()
+    if not stripped:
+        return ExamLine("blank", "")
+    if stripped in SECTION_TITLES:
+        return ExamLine("section", stripped)
+    if ITEM_PATTERN.match(stripped):
+        return ExamLine("item", stripped)
+    return ExamLine("text", stripped)
+
+
+class ExamParser:
+    """
+    增量解析串流中的考卷文字：每收到一段文字就回傳新完成的行，
+    最後一行尚未收到換行前先保留在緩衝區，呼叫 close() 時才送出。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.lines = []
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        *complete, self.buffer = self.buffer.split("\n")
+        parsed = [classify_line(line) for line in complete]
+        self.lines.extend(parsed)
+        return parsed
+
+    def close(self) -> list:
+        parsed = [classify_line(self.buffer)] if self.buffer else []
+        self.buffer = ""
+        self.lines.extend(parsed)
+        return parsed
+
+
+class ParsedExamCache:
+    """以考卷文字為鍵的 LRU 快取，同一份內容重新產生 PDF 時不必再解析。"""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, text: str):
+        with self.lock:
+            lines = self.entries.get(text)
+            if lines is not None:
+                self.entries.move_to_end(text)
+            return lines
+
+    def put(self, text: str, lines):
+        with self.lock:
+            self.entries[text] = tuple(lines)
+            self.entries.move_to_end(text)
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+
+
+parsed_cache = ParsedExamCache()
+
+
+def parse_exam_text(text: str) -> tuple:
+    """解析完整的考卷文字，結果會快取起來。"""
+    lines = parsed_cache.get(text)
+    if lines is None:
+        parser = ExamParser()
+        parser.feed(text)
+        parser.close()
+        lines = tuple(parser.lines)
+        parsed_cache.put(text, lines)
+    return lines
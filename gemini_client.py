@@ -0,0 +1,142 @@
+import os
+import time
+import random
+import asyncio
+import itertools
+import threading
+
+# 各腳本使用的模型集中在這裡設定，可用環境變數 GEMINI_MODEL_<用途> 覆寫（例如 GEMINI_MODEL_QUIZ）
+MODELS = {
+    "classify": "gemini-2.0-flash",
+    "quiz": "gemini-2.5-flash-preview-04-17",
+    "report": "gemini-2.5-pro-exp-03-25",
+    "agent": "gemini-2.0-flash",
+    "agent_lite": "gemini-1.5-flash-8b",
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def model_name(key: str) -> str:
+    """以用途取得模型名稱；傳入的不是已知用途時視為完整的模型名稱。"""
+    if key not in MODELS:
+        return key
+    # 呼叫時才讀環境變數，讓各腳本在 load_dotenv() 之前匯入本模組也能套用 .env 的設定
+    return os.environ.get(f"GEMINI_MODEL_{key.upper()}", MODELS[key])
+
+
+def get_client():
+    """
+    取得整個行程共用的 google-genai Client。
+    Client 內部的 HTTP 連線會保持開啟（keep-alive），之後的請求不必重新建立連線與 TLS 交握。
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            # 只需要模型名稱的腳本（例如 autogen 代理人）不必安裝 google-genai
+            from google import genai
+            from google.genai import types
+
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("請設定環境變數 GEMINI_API_KEY")
+            # 單一請求的逾時秒數（google-genai 以毫秒為單位）
+            timeout = float(os.environ.get("GEMINI_TIMEOUT", 120))
+            _client = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+            )
+        return _client
+
+
+def set_client(client):
+    """替換共用的 Client，供壓力測試或離線測試換成假的用戶端。"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def is_quota_error(e: Exception) -> bool:
+    """判斷是否為配額不足或服務暫時忙碌，這類錯誤稍後重試即可。"""
+    if getattr(e, "code", None) in (429, 503):
+        return True
+    return "RESOURCE_EXHAUSTED" in str(e)
+
+
+def max_retries() -> int:
+    """遇到配額錯誤時的重試次數，由環境變數 GEMINI_MAX_RETRIES 設定。"""
+    return int(os.environ.get("GEMINI_MAX_RETRIES", 5))
+
+
+def _backoff_delay(attempt: int, base_delay: float) -> float:
+    delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+    print(f"配額不足，{delay:.1f} 秒後重試（第 {attempt + 1} 次）")
+    return delay
+
+
+def call_with_backoff(call, retries=None, base_delay=2.0):
+    """
+    執行 call()，遇到配額錯誤時以指數退避（加上隨機抖動）重試，
+    其他錯誤或超過重試次數則直接拋出。
+    """
+    retries = max_retries() if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == retries or not is_quota_error(e):
+                raise
+            time.sleep(_backoff_delay(attempt, base_delay))
+
+
+async def call_with_backoff_async(call, retries=None, base_delay=2.0):
+    """call_with_backoff 的非同步版本，call() 需回傳 awaitable。"""
+    retries = max_retries() if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == retries or not is_quota_error(e):
+                raise
+            await asyncio.sleep(_backoff_delay(attempt, base_delay))
+
+
+def generate(prompt, model="quiz"):
+    """送出請求並回傳完整的回應物件（可讀取 usage_metadata）。"""
+    return call_with_backoff(
+        lambda: get_client().models.generate_content(model=model_name(model), contents=prompt)
+    )
+
+
+def generate_text(prompt, model="quiz") -> str:
+    return generate(prompt, model).text or ""
+
+
+def stream_text(prompt, model="quiz"):
+    """
+    逐段產生模型輸出的文字，略過沒有文字內容的片段。
+    開啟串流到收到第一段為止套用與 generate 相同的配額重試；已經送出文字後就不再重試，
+    以免呼叫端收到重複的內容。
+    """
+    def open_stream():
+        stream = iter(get_client().models.generate_content_stream(model=model_name(model), contents=prompt))
+        # 配額錯誤可能在建立請求或讀取第一段時才拋出
+        return stream, next(stream, None)
+
+    stream, first = call_with_backoff(open_stream)
+    if first is None:
+        return
+    for chunk in itertools.chain([first], stream):
+        if chunk.text:
+            yield chunk.text
+
+
+async def generate_async(prompt, model="quiz"):
+    return await call_with_backoff_async(
+        lambda: get_client().aio.models.generate_content(model=model_name(model), contents=prompt)
+    )
+
+
+async def generate_text_async(prompt, model="quiz") -> str:
+    return (await generate_async(prompt, model)).text or ""
@@ -0,0 +1,155 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 快取檔預設放在專案根目錄，各子資料夾的腳本共用同一份
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite")
+
+
+class LLMCache:
+    """
+    以「模型名稱 + 提示內容」的 SHA-256 為鍵，把 LLM 回覆文字存在 SQLite。
+      - ttl_seconds：超過存活時間的回覆視為過期並刪除；
+      - max_entries / max_bytes：超過上限時從最久未使用的回覆開始淘汰；
+      - enabled=False 時完全略過快取，每次都直接呼叫模型。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=7 * 24 * 3600, max_entries=5000,
+                 max_bytes=200 * 1024 * 1024, enabled=True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            # Gradio 與執行緒池會從不同執行緒呼叫，以 lock 保護同一個連線
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+                " size INTEGER, created REAL, accessed REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed)")
+        return self._conn
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, model_name: str, prompt: str):
+        """取得快取的回覆文字，不存在或已過期時回傳 None。"""
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+
+    def set(self, model_name: str, prompt: str, response: str):
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, len(response.encode("utf-8")), now, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 從最久未使用的開始刪，直到筆數與大小都回到上限內
+        removed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            removed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", removed)
+
+    def cached(self, model_name: str, prompt: str, call, refresh=False):
+        """
+        有快取就直接回傳；否則執行 call() 取得回覆文字並寫入快取。
+        refresh=True 時不讀取快取、一定重新呼叫模型，但新回覆仍會寫入。
+        空白回覆不寫入，避免把失敗結果保留下來。
+        """
+        if not self.enabled:
+            return call()
+        response = None if refresh else self.get(model_name, prompt)
+        if response is not None:
+            print(f"使用 LLM 快取回覆（{model_name}）")
+            return response
+        response = call()
+        if response and response.strip():
+            self.set(model_name, prompt, response)
+        return response
+
+    def cached_stream(self, model_name: str, prompt: str, stream_call, refresh=False):
+        """
+        串流版本：有快取時一次產生完整回覆；否則逐段產生 stream_call() 的文字，
+        完整結束後才寫入快取（中途中斷的回覆不會被保存）。refresh 的意義同 cached()。
+        """
+        if self.enabled and not refresh:
+            response = self.get(model_name, prompt)
+            if response is not None:
+                print(f"使用 LLM 快取回覆（{model_name}）")
+                yield response
+                return
+        pieces = []
+        for piece in stream_call():
+            pieces.append(piece)
+            yield piece
+        response = "".join(pieces)
+        if self.enabled and response.strip():
+            self.set(model_name, prompt, response)
+
+
+_default_cache = None
+
+
+def get_cache() -> LLMCache:
+    """
+    回傳全域共用的快取；可用環境變數設定：
+      LLM_CACHE_PATH、LLM_CACHE_TTL（秒）、LLM_CACHE_MAX_ENTRIES，
+      LLM_CACHE_DISABLE=1 則略過快取。
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache(
+            path=os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)),
+            max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000)),
+            enabled=os.environ.get("LLM_CACHE_DISABLE", "") not in ("1", "true", "True"),
+        )
+    return _default_cache
+
+
+def cached_generate(model_name: str, prompt: str, call, refresh=False):
+    """以全域快取包裝一次模型呼叫，call 為回傳回覆文字的無參數函式。"""
+    return get_cache().cached(model_name, prompt, call, refresh)
+
+
+def cached_generate_stream(model_name: str, prompt: str, stream_call, refresh=False):
+    """以全域快取包裝一次串流呼叫，stream_call 回傳逐段文字的可迭代物件。"""
+    return get_cache().cached_stream(model_name, prompt, stream_call, refresh)
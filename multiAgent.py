@@ -12,13 +12,15 @@ from autogen_agentchat.ui import Console
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_ext.agents.web_surfer import MultimodalWebSurfer
 
+from gemini_client import model_name
+
 async def main():
     # 從 .env 讀取 Gemini API 金鑰
     gemini_api_key = os.environ.get("GEMINI_API_KEY")
     
-    # 使用 Gemini API，指定 model 為 "gemini-1.5-flash-8b"
+    # 使用 Gemini API，模型名稱統一在 gemini_client.MODELS 設定（預設 "gemini-1.5-flash-8b"）
     model_client = OpenAIChatCompletionClient(
-        model="gemini-1.5-flash-8b",
+        model=model_name("agent_lite"),
         api_key=gemini_api_key,
     )
     
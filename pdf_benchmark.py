@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+
+from fpdf import FPDF
+import pandas as pd
+
+from exam_parser import SECTION_TITLES
+from pdf_renderer import (
+    FONT_MISSING_MESSAGE, UNIT_COLORS, PdfJobPool, create_table, find_chinese_font, get_renderer,
+)
+
+
+def sample_exam(questions_per_section=10) -> str:
+    sections = []
+    for title in SECTION_TITLES:
+        sections.append(title)
+        sections.append("海綿寶寶和派大星來到比奇堡的市集，" * 4)
+        for i in range(1, questions_per_section + 1):
+            sections.append(f"{i}.蟹老闆把漢堡的定價提高了三成五，原價是 {i * 20} 元，請問新的定價是多少元？(1)27 (2)35 (3){i * 27} (4)135")
+        sections.append("")
+    return "\n".join(sections)
+
+
+def sample_solution(questions=30) -> str:
+    lines = []
+    for i in range(1, questions + 1):
+        lines.append(f"【第{i}題詳解】")
+        lines.append("先把三成五換成小數 0.35，定價是原價的 1 + 0.35 = 1.35 倍。" * 3)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def benchmark(rounds=20, out_dir="pdf_bench", workers=0):
+    """分別量測考卷與詳解版面每秒可產生的頁數；workers > 0 時同時送進行程池。"""
+    print(f"使用字型：{find_chinese_font()}，工作行程數：{workers or '不使用行程池'}")
+    pool = PdfJobPool(workers)
+    # 工作行程的啟動時間不計入量測
+    pool.start()
+    os.makedirs(out_dir, exist_ok=True)
+    for name, text in [("考卷", sample_exam()), ("詳解", sample_solution())]:
+        started = time.perf_counter()
+        futures = [
+            pool.submit("exam", os.path.join(out_dir, f"{name}_{i}.pdf"), text=text)
+            for i in range(rounds)
+        ]
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+        pages = sum(result["pages"] for result in results)
+        queue = max(result["queue_seconds"] for result in results)
+        print(f"{name}：{rounds} 份共 {pages} 頁，{elapsed:.2f} 秒，{pages / elapsed:.1f} 頁/秒（最長排隊 {queue:.2f} 秒）")
+    pool.shutdown()
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def create_table_iterrows(pdf: FPDF, df: pd.DataFrame):
+    """改寫前以 iterrows 逐列判斷顏色的版本，只留作效能比較的基準。"""
+    available_width = pdf.w - 2 * pdf.l_margin
+    num_columns = len(df.columns)
+    col_width = available_width / num_columns
+    cell_height = 10
+
+    # 表頭：使用淺灰色背景
+    pdf.set_fill_color(200, 200, 200)
+    pdf.set_font("ChineseFont", "", 12)
+    for col in df.columns:
+        pdf.cell(col_width, cell_height, str(col), border=1, align="C", fill=True)
+    pdf.ln(cell_height)
+
+    # 資料行：交替背景色
+    pdf.set_font("ChineseFont", "", 12)
+    fill = False
+    for index, row in df.iterrows():
+        if pdf.get_y() + cell_height > pdf.h - pdf.b_margin:
+            pdf.add_page()
+            pdf.set_fill_color(200, 200, 200)
+            pdf.set_font("ChineseFont", "", 12)
+            for col in df.columns:
+                pdf.cell(col_width, cell_height, str(col), border=1, align="C", fill=True)
+            pdf.ln(cell_height)
+            pdf.set_font("ChineseFont", "", 12)
+
+        admission_method = row['單元'] if '單元' in df.columns else ''
+        if admission_method == '比和比值':
+            pdf.set_text_color(0, 0, 255)  # 藍色
+        elif admission_method == '扇形的弧長和面積':
+            pdf.set_text_color(255, 0, 0)  # 紅色
+        elif admission_method == '圓周率和圓面積':
+            pdf.set_text_color(255, 255, 0)  # 黃色
+        elif admission_method == '數量關係':
+            pdf.set_text_color(0, 255, 0)  # 綠色
+
+        # 交替背景色設定
+        if fill:
+            pdf.set_fill_color(230, 240, 255)
+        else:
+            pdf.set_fill_color(255, 255, 255)
+
+        # 輸出每列的資料
+        for item in row:
+            pdf.cell(col_width, cell_height, str(item), border=1, align="C", fill=True)
+        pdf.ln(cell_height)
+        fill = not fill
+
+    # 恢復預設顏色
+    pdf.set_text_color(0, 0, 0)
+
+
+def sample_table(rows=2000) -> pd.DataFrame:
+    units = list(UNIT_COLORS) + ["其他單元"]
+    df = pd.DataFrame({
+        "題號": range(1, rows + 1),
+        "題型": ["選擇題", "填充題", "應用題"] * (rows // 3) + ["選擇題"] * (rows % 3),
+        "單元": [units[i % len(units)] for i in range(rows)],
+        "錯誤率": [round((i * 37 % 100) / 100, 2) for i in range(rows)],
+    })
+    # 每 7 列留一個空白的單元、每 11 列留一個空白的錯誤率，模擬 CSV 中的缺值
+    df.loc[df.index % 7 == 3, "單元"] = None
+    df.loc[df.index % 11 == 5, "錯誤率"] = None
+    return df
+
+
+def _page_content(pdf: FPDF) -> str:
+    # 建立時間每次不同，比較前先去掉
+    return re.sub(r"/CreationDate \(D:\d+\)", "", pdf.output(dest="S"))
+
+
+def benchmark_table(rows=2000):
+    """
+    比較 iterrows 舊版與預先計算顏色的新版表格，每秒可輸出的列數，
+    並確認兩者輸出的 PDF 內容完全相同（範例資料含空白儲存格）。
+    """
+    renderer = get_renderer()
+    df = sample_table(rows)
+    outputs = []
+    for name, draw in [("iterrows 舊版", create_table_iterrows), ("預先計算新版", create_table)]:
+        started = time.perf_counter()
+        pdf = renderer.new_document()
+        draw(pdf, df)
+        layout = time.perf_counter() - started
+        outputs.append(_page_content(pdf))
+        elapsed = time.perf_counter() - started
+        print(f"{name}：{rows} 列 {pdf.page_no()} 頁，排版 {layout:.2f} 秒（{rows / layout:.0f} 列/秒），含輸出 {elapsed:.2f} 秒")
+    print("兩版輸出內容相同" if outputs[0] == outputs[1] else "警告：兩版輸出內容不同")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pdf_renderer 的效能測試")
+    parser.add_argument("--rounds", type=int, default=20, help="每種版面產生的份數")
+    parser.add_argument("--workers", type=int, default=0, help="行程池的工作行程數，0 表示在主行程直接產生")
+    parser.add_argument("--table-rows", type=int, default=0, help="另外比較表格版面每秒可輸出的列數")
+    args = parser.parse_args()
+    if find_chinese_font() is None:
+        print(FONT_MISSING_MESSAGE)
+        sys.exit(1)
+    benchmark(args.rounds, workers=args.workers)
+    if args.table_rows:
+        benchmark_table(args.table_rows)
@@ -0,0 +1,435 @@
+import os
+import time
+import shutil
+import multiprocessing
+import subprocess
+from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import fpdf
+from fpdf import FPDF
+import pandas as pd
+
+from exam_parser import parse_exam_text
+
+# 專案內附的字型目錄（部署時放入 .ttf 即可當作最後的備援）
+BUNDLED_FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# 依序嘗試的中文字型。PyFPDF 1.7 只能載入單一字型的 TrueType 檔，
+# .ttc 字型集合與 CFF 外框的 .otf（例如 Noto Sans CJK）都無法使用，實際檔案格式另由 is_truetype_font 檢查
+FONT_CANDIDATES = [
+    r"C:\Windows\Fonts\kaiu.ttf",
+    "/usr/share/fonts/truetype/arphic-bkai00mp/bkai00mp.ttf",
+    "/usr/share/fonts/truetype/arphic-bsmi00lp/bsmi00lp.ttf",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/google-droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/truetype/noto/NotoSansTC-Regular.ttf",
+]
+
+FONT_MISSING_MESSAGE = (
+    "找不到可用的中文 TrueType 字型（PyFPDF 不支援 .ttc 與 .otf）："
+    "Debian/Ubuntu 請安裝 fonts-arphic-bkai00mp 或 fonts-droid-fallback，"
+    "或以 PDF_FONT_PATH 指定 .ttf 檔（例如 Windows 的標楷體 kaiu.ttf）"
+)
+
+# 字型度量改由 CachedFontPDF 在記憶體中快取，不再把 .pkl 寫到系統字型目錄旁
+if hasattr(fpdf, "set_global"):
+    fpdf.set_global("FPDF_CACHE_MODE", 1)
+
+
+def is_truetype_font(path: str) -> bool:
+    """檢查檔頭：只接受單一字型的 TrueType（0x00010000 或 'true'），排除 'ttcf' 字型集合與 'OTTO' CFF 字型。"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) in (b"\x00\x01\x00\x00", b"true")
+    except OSError:
+        return False
+
+
+def _fontconfig_fonts() -> list:
+    """以 fontconfig 列出系統上支援繁體中文的 TrueType 字型檔，只保留 PyFPDF 能載入的檔案。"""
+    if shutil.which("fc-list") is None:
+        return []
+    try:
+        result = subprocess.run(
+            ["fc-list", ":lang=zh-tw:fontformat=TrueType", "file"],
+            capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return []
+    # 每行格式為「路徑: 」；fontformat=TrueType 也會列出 .ttc，因此仍需檢查檔頭
+    paths = sorted({line.strip().rstrip(":").strip() for line in result.stdout.splitlines() if line.strip()})
+    return [path for path in paths if is_truetype_font(path)]
+
+
+@lru_cache(maxsize=1)
+def find_chinese_font():
+    """
+    尋找 PyFPDF 能載入的中文字型，每個行程只找一次：
+      1. 環境變數 PDF_FONT_PATH；
+      2. 常見的 Windows / Linux 字型路徑；
+      3. fontconfig（fc-list）列出的繁體中文 TrueType 字型；
+      4. 專案內 fonts/ 目錄中的 .ttf。
+    每個候選都會檢查檔頭，找不到時回傳 None（錯誤訊息見 FONT_MISSING_MESSAGE）。
+    """
+    override = os.environ.get("PDF_FONT_PATH")
+    if override:
+        if is_truetype_font(override):
+            return os.path.abspath(override)
+        print(f"PDF_FONT_PATH 不是可用的 TrueType 字型（不支援 .ttc／.otf）：{override}")
+    for path in FONT_CANDIDATES:
+        if is_truetype_font(path):
+            return os.path.abspath(path)
+    fonts = _fontconfig_fonts()
+    if fonts:
+        return fonts[0]
+    if os.path.isdir(BUNDLED_FONT_DIR):
+        for name in sorted(os.listdir(BUNDLED_FONT_DIR)):
+            path = os.path.join(BUNDLED_FONT_DIR, name)
+            if name.lower().endswith(".ttf") and is_truetype_font(path):
+                return path
+    return None
+
+
+class CachedFontPDF(FPDF):
+    """
+    字型度量只解析一次的 FPDF：第一次 add_font 之後把解析結果存在類別層級，
+    之後的文件直接複製使用，不必每份 PDF 都重新讀取數 MB 的中文字型。
+    實際嵌入的子集仍依每份文件用到的字元產生。
+    """
+
+    _font_cache = {}
+
+    def add_font(self, family, style="", fname="", uni=False):
+        key = (family.lower(), style.upper(), fname)
+        cached = self._font_cache.get(key)
+        if cached is not None:
+            fontkey, font, font_files = cached
+            if fontkey not in self.fonts:
+                self.fonts[fontkey] = dict(font, i=len(self.fonts) + 1, subset=list(font["subset"]))
+                self.font_files.update({name: dict(entry) for name, entry in font_files.items()})
+            return
+
+        super().add_font(family, style, fname, uni=uni)
+        fontkey = family.lower() + style.upper()
+        font = self.fonts.get(fontkey)
+        # 只快取 PyFPDF 的 Unicode 字型（其他版本的結構不同，照常每次載入）
+        if uni and isinstance(font, dict) and "subset" in font:
+            font_files = {name: dict(self.font_files[name]) for name in (fontkey, fname) if name in self.font_files}
+            self._font_cache[key] = (fontkey, dict(font, subset=list(font["subset"])), font_files)
+
+
+class PdfRenderer:
+    """可重複使用的 PDF 產生器：字型路徑與字型度量在整個行程中共用。"""
+
+    def __init__(self, font_path=None, font_size=12, line_height=8):
+        self.font_path = font_path or find_chinese_font()
+        self.font_size = font_size
+        self.line_height = line_height
+
+    def new_document(self) -> FPDF:
+        """建立已註冊中文字型（名稱為 ChineseFont）的 A4 文件。"""
+        if not self.font_path:
+            raise FileNotFoundError(FONT_MISSING_MESSAGE)
+        pdf = CachedFontPDF(format="A4")
+        pdf.add_page()
+        pdf.add_font("ChineseFont", "", self.font_path, uni=True)
+        pdf.set_font("ChineseFont", size=self.font_size)
+        return pdf
+
+    def render_exam(self, text: str, pdf_filename: str) -> int:
+        """依考卷／詳解的版面輸出 PDF，回傳頁數；解析結果會快取，同一份文字不必再解析。"""
+        return self.render_exam_lines(parse_exam_text(text), pdf_filename)
+
+    def render_exam_lines(self, lines, pdf_filename: str) -> int:
+        """以已解析的 ExamLine 輸出考卷／詳解 PDF，回傳頁數。"""
+        layout = ExamLayout(self)
+        for line in lines:
+            layout.add(line)
+        return layout.finish(pdf_filename)
+
+    def render_report(self, pdf_filename: str, text: str = None, df: pd.DataFrame = None) -> int:
+        """報表版面：有 DataFrame 時畫成表格，否則直接輸出文字，回傳頁數。"""
+        pdf = self.new_document()
+        if df is not None:
+            create_table(pdf, df)
+        elif text is not None:
+            pdf.multi_cell(0, 10, text)
+        else:
+            pdf.cell(0, 10, "沒有可呈現的內容")
+        pdf.output(pdf_filename)
+        return pdf.page_no()
+
+
+# 各單元在表格中的文字顏色；不在表中的單元沿用上一列的顏色（與原本逐列判斷的結果相同）
+UNIT_COLORS = {
+    "比和比值": (0, 0, 255),          # 藍色
+    "扇形的弧長和面積": (255, 0, 0),   # 紅色
+    "圓周率和圓面積": (255, 255, 0),   # 黃色
+    "數量關係": (0, 255, 0),          # 綠色
+}
+HEADER_FILL = (200, 200, 200)
+ROW_FILLS = ((255, 255, 255), (230, 240, 255))
+
+
+def table_row_colors(df: pd.DataFrame) -> list:
+    """一次算出每一列的文字顏色（以 單元 欄對照 UNIT_COLORS），回傳 (r, g, b) 清單。"""
+    if "單元" not in df.columns:
+        return [(0, 0, 0)] * len(df)
+    colors = df["單元"].map(UNIT_COLORS).ffill()
+    return [color if isinstance(color, tuple) else (0, 0, 0) for color in colors]
+
+
+def _table_header(pdf: FPDF, columns, col_width, cell_height):
+    pdf.set_fill_color(*HEADER_FILL)
+    for col in columns:
+        pdf.cell(col_width, cell_height, col, border=1, align="C", fill=True)
+    pdf.ln(cell_height)
+
+
+def create_table(pdf: FPDF, df: pd.DataFrame):
+    """
+    使用 FPDF 將 DataFrame 以漂亮的表格形式繪製至 PDF，
+    使用交替背景色與標題區塊，並自動處理分頁。
+    每列的顏色事先以對照表算好，各欄一次轉成字串，再以一頁為單位取出 tuple 輸出，
+    不必逐列建立 Series 與判斷 if/elif。
+    """
+    available_width = pdf.w - 2 * pdf.l_margin
+    col_width = available_width / len(df.columns)
+    cell_height = 10
+    columns = [str(col) for col in df.columns]
+    colors = table_row_colors(df)
+    # 每欄一次轉成字串清單，之後逐頁以 zip 取出純 tuple；
+    # 用 map(str) 而不是 astype(str)：pandas 3 的 astype(str) 會保留 NaN，空白儲存格應和逐列 str() 一樣輸出 "nan"
+    texts = [df[col].map(str).tolist() for col in df.columns]
+
+    pdf.set_font("ChineseFont", "", 12)
+    _table_header(pdf, columns, col_width, cell_height)
+
+    # 文件預設的文字顏色為黑色，開頭未對應到單元的列不必再設定
+    current_color = (0, 0, 0)
+    start = 0
+    while start < len(df):
+        if start > 0:
+            pdf.add_page()
+            _table_header(pdf, columns, col_width, cell_height)
+        # 這一頁還放得下幾列
+        capacity = max(1, int((pdf.h - pdf.b_margin - pdf.get_y()) / cell_height + 1e-9))
+        end = min(start + capacity, len(df))
+        rows = zip(*(column[start:end] for column in texts))
+        for offset, row in enumerate(rows, start=start):
+            if colors[offset] != current_color:
+                current_color = colors[offset]
+                pdf.set_text_color(*current_color)
+            # 交替背景色設定
+            pdf.set_fill_color(*ROW_FILLS[offset % 2])
+            for item in row:
+                pdf.cell(col_width, cell_height, item, border=1, align="C", fill=True)
+            pdf.ln(cell_height)
+        start = end
+
+    # 恢復預設顏色
+    pdf.set_text_color(0, 0, 0)
+
+
+class ExamLayout:
+    """
+    逐行排版考卷／詳解：串流時每解析出一行就可以呼叫 add()，模型還在生成時就開始排版。
+    題目行需要知道下一行才能決定間距，因此會延後一行才畫出。
+    """
+
+    def __init__(self, renderer: PdfRenderer):
+        self.pdf = renderer.new_document()
+        self.line_height = renderer.line_height
+        self.pdf.set_y(15)
+        self.pending = None
+        self.prev_line_was_question = False
+        self.prev_line_was_section_title = False
+
+    def add(self, line):
+        if self.pending is not None:
+            self._draw(self.pending, line)
+        self.pending = line
+
+    def close(self) -> FPDF:
+        """畫出最後一行並回傳排好版的文件，可交給 PdfJobPool.render_document 輸出。"""
+        if self.pending is not None:
+            self._draw(self.pending, None)
+            self.pending = None
+        return self.pdf
+
+    def finish(self, pdf_filename: str) -> int:
+        pdf = self.close()
+        pdf.output(pdf_filename)
+        return pdf.page_no()
+
+    def _draw(self, line, next_line):
+        pdf = self.pdf
+        line_height = self.line_height
+
+        if line.kind == "section":
+            pdf.ln(8)
+            pdf.set_font("ChineseFont", size=14)
+            pdf.multi_cell(0, line_height, line.text, border=0, align='L')
+            pdf.ln(6)
+            self.prev_line_was_question = False
+            self.prev_line_was_section_title = True
+
+        elif line.kind == "item":
+            if self.prev_line_was_section_title:
+                pdf.ln(10)
+            pdf.set_font("ChineseFont", size=12)
+            pdf.multi_cell(0, line_height, line.text, border=0, align='L')
+            self.prev_line_was_question = True
+            self.prev_line_was_section_title = False
+
+            if next_line is None or next_line.kind in ("section", "blank"):
+                pdf.ln(2)
+
+        elif line.kind != "blank":
+            pdf.set_font("ChineseFont", size=12)
+            if self.prev_line_was_question:
+                pdf.ln(2)
+            pdf.multi_cell(0, line_height, line.text, border=0, align='L')
+            self.prev_line_was_question = False
+            self.prev_line_was_section_title = False
+
+        if pdf.get_y() > pdf.h - 15:
+            pdf.add_page()
+            pdf.set_y(15)
+
+
+@lru_cache(maxsize=1)
+def get_renderer() -> PdfRenderer:
+    return PdfRenderer()
+
+
+def pdf_filename_now(prefix="report") -> str:
+    """以時間（含微秒）命名，同時有多份 PDF 在產生時檔名不會衝突。"""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.pdf"
+
+
+def _render_job(layout: str, pdf_filename: str, text, df, submitted: float) -> dict:
+    """
+    在工作行程中執行：每個行程各自持有一個 PdfRenderer，字型只載入一次。
+    exam 版面的 text 為主行程已解析好的 ExamLine。
+    """
+    started = time.time()
+    renderer = get_renderer()
+    if layout == "exam":
+        pages = renderer.render_exam_lines(text, pdf_filename)
+    else:
+        pages = renderer.render_report(pdf_filename, text=text, df=df)
+    finished = time.time()
+    return {
+        "path": os.path.abspath(pdf_filename),
+        "pages": pages,
+        "queue_seconds": round(started - submitted, 3),
+        "render_seconds": round(finished - started, 3),
+    }
+
+
+def _output_job(pdf: FPDF, pdf_filename: str, submitted: float) -> dict:
+    """在工作行程中輸出已排好版的文件（字型子集化與壓縮）。"""
+    started = time.time()
+    pdf.output(pdf_filename)
+    finished = time.time()
+    return {
+        "path": os.path.abspath(pdf_filename),
+        "pages": pdf.page_no(),
+        "queue_seconds": round(started - submitted, 3),
+        "render_seconds": round(finished - started, 3),
+    }
+
+
+def _warm_up():
+    """工作行程的 initializer：每個行程啟動時先載入字型度量，第一份 PDF 不必等待。"""
+    if find_chinese_font():
+        get_renderer().new_document()
+
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+
+def default_workers() -> int:
+    # spawn 的每個工作行程都會重新匯入啟動的腳本，大型主機上不依核心數無上限地增加
+    return min(4, os.cpu_count() or 1)
+
+
+class PdfJobPool:
+    """
+    以行程池產生 PDF，FPDF 版面計算不會卡住 Gradio 的事件迴圈，也不必搶同一個 GIL。
+    submit() 回傳 Future，結果為 {path, pages, queue_seconds, render_seconds}；
+    workers=0 時改在目前的執行緒直接產生（除錯或無法建立子行程時使用）。
+    工作行程預設以 spawn 建立（環境變數 PDF_START_METHOD 可改為 forkserver）：
+    池子在 Gradio 的執行緒都已啟動後才用到，在多執行緒的行程中 fork 可能死結。
+    """
+
+    def __init__(self, workers=None, start_method=None):
+        self.workers = default_workers() if workers is None else workers
+        start_method = start_method or os.environ.get("PDF_START_METHOD", "spawn")
+        # 每個工作行程啟動時各自以 _warm_up 載入字型，不論之後由哪個行程接到工作
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context(start_method),
+            initializer=_warm_up,
+        ) if self.workers > 0 else None
+
+    def start(self):
+        """
+        先建立所有工作行程，建議在 demo.launch() 之前呼叫。
+        spawn 只在送出工作時才逐一建立行程，這裡送出與行程數相同的工作讓每個行程都先啟動；
+        重新匯入腳本與載入字型的時間改在啟動時花掉，不落在第一位使用者身上。
+        """
+        if self.executor is None:
+            return
+        started = time.perf_counter()
+        for future in [self.executor.submit(_worker_pid) for _ in range(self.workers)]:
+            future.result()
+        print(f"PDF 行程池已啟動 {self.workers} 個工作行程，{time.perf_counter() - started:.2f} 秒")
+
+    def submit(self, layout: str, pdf_filename: str = None, text: str = None, df: pd.DataFrame = None):
+        """layout 為 "exam"（考卷／詳解）或 "report"（表格報表）。"""
+        pdf_filename = pdf_filename or pdf_filename_now()
+        if layout == "exam":
+            # 在主行程解析並快取，工作行程只負責排版
+            text = parse_exam_text(text)
+        return self._submit(_render_job, layout, pdf_filename, text, df, time.time())
+
+    def _submit(self, job, *args):
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(job(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.executor.submit(job, *args)
+
+    @staticmethod
+    def _log(result: dict) -> dict:
+        print(f"PDF 完成：{result['path']}（{result['pages']} 頁，排隊 {result['queue_seconds']:.2f} 秒，產生 {result['render_seconds']:.2f} 秒）")
+        return result
+
+    def render(self, layout: str, pdf_filename: str = None, text: str = None, df: pd.DataFrame = None) -> dict:
+        return self._log(self.submit(layout, pdf_filename, text=text, df=df).result())
+
+    def render_document(self, pdf: FPDF, pdf_filename: str = None) -> dict:
+        """
+        輸出已在主行程排好版的文件（例如串流時的 ExamLayout）。
+        排版本身很輕，最耗 CPU 的字型子集化與壓縮在 output()，因此這一步仍交給工作行程。
+        """
+        pdf_filename = pdf_filename or pdf_filename_now()
+        return self._log(self._submit(_output_job, pdf, pdf_filename, time.time()).result())
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+@lru_cache(maxsize=1)
+def get_pdf_pool() -> PdfJobPool:
+    """整個應用共用的 PDF 行程池，工作行程數由環境變數 PDF_WORKERS 決定（預設為核心數，最多 4 個）。"""
+    workers = os.environ.get("PDF_WORKERS")
+    return PdfJobPool(int(workers) if workers is not None else None)
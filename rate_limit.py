@@ -0,0 +1,42 @@
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    每分鐘 rate_per_minute 次的令牌桶限流器，最多可累積 burst 個令牌。
+    同時提供同步（執行緒）與非同步（asyncio）兩種取得令牌的方式；
+    rate_per_minute 為 None 或 <= 0 時不限流。
+    """
+
+    def __init__(self, rate_per_minute=None, burst=1):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """預先扣除一個令牌，回傳需要等待的秒數。"""
+        if not self.rate_per_minute or self.rate_per_minute <= 0:
+            return 0.0
+        rate_per_second = self.rate_per_minute / 60.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate_per_second)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / rate_per_second
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,59 @@
+import re
+import threading
+
+# 中日韓文字與全形符號大約一字一個 token，其他文字大約四個字元一個 token
+CJK_PATTERN = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text) -> int:
+    """粗估一段文字的 token 數，用來決定每個請求要放幾筆資料。"""
+    text = str(text)
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def pack_by_budget(texts, budget: int, overhead: int = 0, max_items=None, separator_tokens: int = 2):
+    """
+    依序把 texts 裝進批次，讓每批的估計 token 數（overhead + 各筆資料）不超過 budget，
+    產生 (start_idx, end_idx, estimated_tokens)。單筆就超過預算時仍單獨成一批。
+    """
+    start_idx = 0
+    used = overhead
+    for idx, text in enumerate(texts):
+        cost = estimate_tokens(text) + separator_tokens
+        full = max_items is not None and idx - start_idx >= max_items
+        if idx > start_idx and (used + cost > budget or full):
+            yield start_idx, idx, used
+            start_idx, used = idx, overhead
+        used += cost
+    if start_idx < len(texts):
+        yield start_idx, len(texts), used
+
+
+class TokenReport:
+    """記錄每個請求的估計 token 數與模型實際回報的 prompt tokens，最後輸出比較。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def record(self, label, estimated: int, actual):
+        with self.lock:
+            self.records.append((label, estimated, actual))
+        if actual:
+            print(f"[{label}] 估計 {estimated} tokens，實際 prompt_tokens {actual}（{actual / max(estimated, 1):.2f} 倍）")
+        else:
+            print(f"[{label}] 估計 {estimated} tokens")
+
+    def summary(self) -> str:
+        with self.lock:
+            measured = [(est, act) for _, est, act in self.records if act]
+            total_estimated = sum(est for _, est, _ in self.records)
+        if not measured:
+            return f"共 {len(self.records)} 個請求，估計 {total_estimated} tokens（沒有模型回報的實際值）"
+        estimated = sum(est for est, _ in measured)
+        actual = sum(act for _, act in measured)
+        return (
+            f"共 {len(self.records)} 個請求，估計 {total_estimated} tokens；"
+            f"有實際值的 {len(measured)} 個請求估計 {estimated}、實際 {actual}（實際/估計 {actual / max(estimated, 1):.2f}）"
+        )
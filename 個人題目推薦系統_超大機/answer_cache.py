@@ -0,0 +1,86 @@
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# 共用模組放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coerror import META_COLUMNS, answer_columns
+
+CATEGORICAL_COLUMNS = ["題型", "單元"]
+
+
+def file_hash(path: str) -> str:
+    """以檔案內容計算 SHA-256，同一份 CSV 重新上傳仍會得到相同的鍵。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def student_columns(df: pd.DataFrame) -> list:
+    """已解析 DataFrame 的學生欄位：parse_answer_csv 只把 0/1 作答欄位轉成 int8／Int8。"""
+    return [
+        col for col in df.columns
+        if col not in META_COLUMNS and str(df[col].dtype) in ("int8", "Int8")
+    ]
+
+
+def parse_answer_csv(path: str) -> pd.DataFrame:
+    """
+    讀取並驗證答題 CSV：
+      - 學生欄位為只含 0/1（可留空）的欄位，判斷方式與 coerror 相同，其他多出來的欄位保留原樣；
+      - 學生欄位轉成 int8，有空白時改用可為空的 Int8；
+      - 題型、單元轉成 categorical；
+    格式不符時拋出 ValueError，訊息可直接顯示給使用者。
+    """
+    df = pd.read_csv(path)
+    students, answers = answer_columns(df)
+    if not students:
+        raise ValueError("CSV 中找不到只含 0/1 的學生作答欄位，請確認格式。")
+
+    for col in students:
+        df[col] = answers[col].astype("Int8") if answers[col].isna().any() else answers[col].astype("int8")
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+class AnswerFrameCache:
+    """以檔案內容雜湊為鍵、最多保留 max_items 份的 LRU 快取，存放已解析好的 DataFrame。"""
+
+    def __init__(self, max_items=16):
+        self.max_items = max_items
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, path: str) -> pd.DataFrame:
+        key = file_hash(path)
+        with self.lock:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                return self.frames[key]
+        df = parse_answer_csv(path)
+        with self.lock:
+            self.frames[key] = df
+            self.frames.move_to_end(key)
+            while len(self.frames) > self.max_items:
+                self.frames.popitem(last=False)
+        return df
+
+
+answer_cache = AnswerFrameCache()
+
+
+def load_answer_frame(path: str) -> pd.DataFrame:
+    """
+    取得已解析的答題 DataFrame；同一份內容只解析一次。
+    回傳的 DataFrame 由所有處理函式共用，請勿直接修改。
+    """
+    return answer_cache.load(path)
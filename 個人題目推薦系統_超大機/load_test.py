@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+# 壓力測試不連網：主題搜尋用離線資料、不使用回應快取，模型換成固定延遲的假模型
+os.environ.setdefault("THEME_SEARCH_BACKEND", "stub")
+os.environ["LLM_CACHE_DISABLE"] = "1"
+os.environ["QUIZ_SPECULATIVE_SOLUTION"] = "0"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+import quiz_final
+from gemini_client import set_client
+
+STUB_EXAM = """一、是非題
+海綿寶寶和派大星來到比奇堡的市集。
+1.蟹老闆把漢堡的定價提高了三成五，新的定價是原價的1.35倍。
+二、選擇題
+章魚哥數了數收銀機裡的硬幣。
+1.比值3/11的前項是多少？(1)3 (2)11 (3)14 (4)33
+三、應用題
+珊迪要幫比奇堡的操場畫平面圖。
+1.比例尺為1:500，圖上長12公分的跑道實際長多少公尺？
+"""
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(prompt_token_count=None)
+
+
+class StubModels:
+    """取代 Client.models：等待固定秒數後回傳固定的考卷內容，模擬網路延遲。"""
+
+    def __init__(self, latency=1.0, chunks=5):
+        self.latency = latency
+        self.chunks = chunks
+
+    def generate_content(self, model, contents):
+        time.sleep(self.latency)
+        return StubResponse(STUB_EXAM)
+
+    def generate_content_stream(self, model, contents):
+        size = len(STUB_EXAM) // self.chunks + 1
+        for i in range(0, len(STUB_EXAM), size):
+            time.sleep(self.latency / self.chunks)
+            yield StubResponse(STUB_EXAM[i:i + size])
+
+
+async def call_exam(csv_file, student_name):
+    async for _ in quiz_final.gradio_handler_async(csv_file, student_name, "海綿寶寶", 1, 1, 1):
+        pass
+
+
+async def call_solution(csv_file, student_name):
+    await quiz_final.generate_solution_pdf_async(STUB_EXAM)
+
+
+async def call_feedback(csv_file, student_name):
+    await quiz_final.generate_feedback_handler_async(csv_file, student_name)
+
+
+EVENTS = {
+    "exam": (call_exam, quiz_final.EXAM_CONCURRENCY),
+    "solution": (call_solution, quiz_final.SOLUTION_CONCURRENCY),
+    "feedback": (call_feedback, quiz_final.FEEDBACK_CONCURRENCY),
+}
+
+
+async def run_users(event, users, requests_per_user, limit, csv_file, student_name) -> list:
+    """users 位使用者同時各送出 requests_per_user 個請求；以 limit 模擬該事件的 concurrency_limit。"""
+    call, _ = EVENTS[event]
+    gate = asyncio.Semaphore(limit)
+    latencies = []
+
+    async def user():
+        for _ in range(requests_per_user):
+            started = time.perf_counter()
+            # 排隊等待的時間也算在延遲內，和 Gradio 佇列的行為一致
+            async with gate:
+                await call(csv_file, student_name)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(user() for _ in range(users)))
+    return latencies
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以假模型對 quiz_final 的非同步處理函式做壓力測試")
+    parser.add_argument("--event", choices=sorted(EVENTS), default="exam", help="要測試的事件")
+    parser.add_argument("--users", default="1,2,4,8,16", help="同時使用者數，以逗號分隔")
+    parser.add_argument("--requests", type=int, default=3, help="每位使用者送出的請求數")
+    parser.add_argument("--latency", type=float, default=1.0, help="假模型每次回應的秒數")
+    parser.add_argument("--limit", type=int, default=None, help="同時處理的請求數，預設使用 quiz_final 的設定")
+    parser.add_argument("--csv", default=os.path.join(SCRIPT_DIR, "test_01-2.csv"), help="答題資料 CSV")
+    parser.add_argument("--student", default="張智翔", help="學生姓名")
+    args = parser.parse_args()
+
+    set_client(SimpleNamespace(models=StubModels(args.latency)))
+    limit = args.limit or EVENTS[args.event][1]
+    csv_file = SimpleNamespace(name=os.path.abspath(args.csv))
+
+    # 測試產生的 PDF 都放在暫存目錄，結束後刪除
+    work_dir = tempfile.mkdtemp(prefix="quiz_load_test_")
+    os.chdir(work_dir)
+
+    print(f"事件：{args.event}，同時處理上限 {limit}，假模型延遲 {args.latency} 秒")
+    print("使用者數\t請求數\t總秒數\t每秒請求數\tp50 秒\tp95 秒")
+    for users in [int(n) for n in args.users.split(",")]:
+        started = time.perf_counter()
+        latencies = asyncio.run(run_users(args.event, users, args.requests, limit, csv_file, args.student))
+        elapsed = time.perf_counter() - started
+        print(
+            f"{users}\t{len(latencies)}\t{elapsed:.2f}\t{len(latencies) / elapsed:.2f}\t"
+            f"{percentile(latencies, 0.5):.2f}\t{percentile(latencies, 0.95):.2f}"
+        )
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,61 @@
 import os
-import re
+import sys
+import asyncio
+import time
+import zipfile
+import threading
 import pandas as pd
 from dotenv import load_dotenv
-import google.generativeai as genai
-from fpdf import FPDF
-import gradio as gr
 from datetime import datetime
-from duckduckgo_search import DDGS
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+# 共用模組放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import cached_generate, cached_generate_stream
+from gemini_client import generate, generate_text, stream_text, model_name
+from answer_cache import load_answer_frame, student_columns
+from theme_search import theme_cache
+from student_profile import build_student_profile
+from rate_limit import TokenBucket
+from token_budget import estimate_tokens
+from pdf_renderer import FONT_MISSING_MESSAGE, ExamLayout, find_chinese_font, get_pdf_pool, get_renderer
+from exam_parser import ExamParser, parsed_cache
 
 load_dotenv()
 
-def get_chinese_font_file() -> str:
-    fonts_path = r"C:\\Windows\\Fonts"
-    candidates = ["kaiu.ttf", "msjh.ttc", "msjhbd.ttc", "msjhl.ttc"]
-    for font in candidates:
-        font_path = os.path.join(fonts_path, font)
-        if os.path.exists(font_path):
-            return os.path.abspath(font_path)
-    return None
+MODEL_NAME = model_name("quiz")
+
+# 考卷內容是否邊生成邊顯示（QUIZ_STREAM=0 時改回等待完整回覆）
+STREAM_OUTPUT = os.environ.get("QUIZ_STREAM", "1") != "0"
+
+# 串流時是否邊收到文字邊解析並排版 PDF（QUIZ_PROGRESSIVE_PDF=0 時改回生成完畢後才交給 PDF 行程池）
+PROGRESSIVE_PDF = os.environ.get("QUIZ_PROGRESSIVE_PDF", "1") != "0"
+
+# 全班批次生成時同時處理的學生數與每分鐘請求上限
+BATCH_WORKERS = int(os.environ.get("QUIZ_BATCH_WORKERS", 4))
+BATCH_RPM = float(os.environ.get("QUIZ_BATCH_RPM", 10))
+
+# 考卷完成後是否立刻在背景先產生詳解（QUIZ_SPECULATIVE_SOLUTION=1 時開啟）
+SPECULATIVE_SOLUTION = os.environ.get("QUIZ_SPECULATIVE_SOLUTION", "0") == "1"
+solution_executor = ThreadPoolExecutor(max_workers=2)
+
+# 是否使用非同步處理函式（QUIZ_ASYNC=0 時改回同步版本），以及各事件同時處理的請求數與佇列上限
+ASYNC_HANDLERS = os.environ.get("QUIZ_ASYNC", "1") != "0"
+EXAM_CONCURRENCY = int(os.environ.get("QUIZ_EXAM_CONCURRENCY", 4))
+SOLUTION_CONCURRENCY = int(os.environ.get("QUIZ_SOLUTION_CONCURRENCY", 4))
+FEEDBACK_CONCURRENCY = int(os.environ.get("QUIZ_FEEDBACK_CONCURRENCY", 8))
+BATCH_CONCURRENCY = int(os.environ.get("QUIZ_BATCH_CONCURRENCY", 1))
+QUEUE_SIZE = int(os.environ.get("QUIZ_QUEUE_SIZE", 64))
 
 def search_theme_info(theme: str, max_results: int = 3) -> str:
-    with DDGS() as ddgs:
-        results = ddgs.text(theme, max_results=max_results)
-        summaries = []
-        for i, res in enumerate(results):
-            title = res.get("title", "")
-            snippet = res.get("body", "")
-            summaries.append(f"{i+1}. {title}：{snippet}")
-        return "\n".join(summaries) if summaries else f"沒有找到與『{theme}』相關的資料。"
+    # 主題輸入時已在背景預先搜尋，這裡多半直接命中快取
+    results = theme_cache.get(theme, max_results=max_results)
+    summaries = []
+    for i, res in enumerate(results):
+        title = res.get("title", "")
+        snippet = res.get("body", "")
+        summaries.append(f"{i+1}. {title}：{snippet}")
+    return "\n".join(summaries) if summaries else f"沒有找到與『{theme}』相關的資料。"
 
 def generate_prompt(student_name: str, theme: str, num_tf: int, num_mc: int, num_app: int, theme_info: str) -> str:
     return f"""你是一名資深數學老師，請根據"{student_name}"同學的答題狀況與所有人的易錯題目進行錯誤題目預測：
@@ -43,8 +71,7 @@ def generate_prompt(student_name: str, theme: str, num_tf: int, num_mc: int, num
 4. 每題內容應接續前題情節，不可跳躍、無關或另開新章。\n
 5. 題目務必與數學概念相關，切勿出現答案與解說。\n
 6. 所有題目須用繁體中文撰寫，語句清晰。\n
-7. 其中0表示該學生在該題答錯，1表示該題答對，\n
-8. "題目"的欄位為該份考卷所有的題目\n
+7. 請針對答題摘要中該生錯誤率高於全班的單元與題型加強出題。\n
 
 📄 題目格式規定如下（必須遵守）：
 一、是非題  
@@ -74,68 +101,43 @@ def generate_prompt(student_name: str, theme: str, num_tf: int, num_mc: int, num
 - 禁止產出除題目以外的內容。
 """
 
-def generate_pdf(text: str) -> str:
-    pdf = FPDF(format="A4")
-    pdf.add_page()
-
-    font_path = get_chinese_font_file()
-    if not font_path:
-        return "錯誤：找不到中文字型，請安裝 kaiu.ttf 或 msjh.ttc"
-
-    pdf.add_font("ChineseFont", "", font_path, uni=True)
-    pdf.set_font("ChineseFont", size=12)
-
-    y_offset = 15
-    line_height = 8
-    pdf.set_y(y_offset)
-
-    lines = text.splitlines()
-    prev_line_was_question = False
-    prev_line_was_section_title = False
-
-    for idx, line in enumerate(lines):
-        stripped = line.strip()
-
-        if stripped in ["一、是非題", "二、選擇題", "三、應用題"]:
-            pdf.ln(8)
-            pdf.set_font("ChineseFont", size=14)
-            pdf.multi_cell(0, line_height, stripped, border=0, align='L')
-            pdf.ln(6)
-            prev_line_was_question = False
-            prev_line_was_section_title = True
-
-        elif re.match(r"^\d+\.", stripped):
-            if prev_line_was_section_title:
-                pdf.ln(10)
-            pdf.set_font("ChineseFont", size=12)
-            pdf.multi_cell(0, line_height, stripped, border=0, align='L')
-            prev_line_was_question = True
-            prev_line_was_section_title = False
-
-            next_line = lines[idx + 1].strip() if idx + 1 < len(lines) else ""
-            if next_line in ["一、是非題", "二、選擇題", "三、應用題"] or next_line == "":
-                pdf.ln(2)
-
-        elif stripped:
-            pdf.set_font("ChineseFont", size=12)
-            if prev_line_was_question:
-                pdf.ln(2)
-            pdf.multi_cell(0, line_height, stripped, border=0, align='L')
-            prev_line_was_question = False
-            prev_line_was_section_title = False
-
-        if pdf.get_y() > pdf.h - 15:
-            pdf.add_page()
-            pdf.set_y(15)
-
-    pdf_filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    pdf.output(pdf_filename)
-    return pdf_filename
-
-def generate_solution_pdf(question_text: str) -> str:
-    if not question_text.strip():
-        return "錯誤：沒有可產生詳解的題目內容", None
-
+def generate_pdf(text: str, pdf_filename: str = None) -> str:
+    """交給 PDF 行程池產生考卷／詳解，回傳檔案路徑。"""
+    if not find_chinese_font():
+        return f"錯誤：{FONT_MISSING_MESSAGE}"
+    return get_pdf_pool().render("exam", pdf_filename, text=text)["path"]
+
+def trim_blank_lines(lines) -> tuple:
+    """去掉頭尾的空行，讓串流解析的結果與解析 strip() 後的全文一致。"""
+    lines = list(lines)
+    while lines and lines[0].kind == "blank":
+        lines.pop(0)
+    while lines and lines[-1].kind == "blank":
+        lines.pop()
+    return tuple(lines)
+
+def stream_exam_with_layout(prompt, regenerate=False):
+    """
+    串流產生考卷並同步排版：每收到一段文字就解析出完整的行交給 ExamLayout，
+    模型生成完畢時版面也已排好，只剩輸出檔案（字型子集化與壓縮）交給 PDF 行程池。
+    逐段產生 (累積文字, None)，最後產生 (全文, PDF 路徑)。
+    """
+    parser = ExamParser()
+    layout = ExamLayout(get_renderer())
+    response_text = ""
+    for piece in cached_generate_stream(MODEL_NAME, prompt, lambda: stream_text(prompt, MODEL_NAME), refresh=regenerate):
+        response_text += piece
+        for line in parser.feed(piece):
+            layout.add(line)
+        yield response_text, None
+    for line in parser.close():
+        layout.add(line)
+    response_text = response_text.strip()
+    # 解析結果存入快取，之後用同一份考卷產生 PDF 時不必再解析
+    parsed_cache.put(response_text, trim_blank_lines(parser.lines))
+    yield response_text, get_pdf_pool().render_document(layout.close())["path"]
+
+def build_solution_text(question_text: str) -> str:
     solution_prompt = f"""你是一名有經驗的數學老師，請根據以下這份考卷內容，為每一題撰寫詳解（僅限題目部分，不要重新編寫考卷或故事背景）：
 
 {question_text}
@@ -150,34 +152,207 @@ def generate_solution_pdf(question_text: str) -> str:
 4. 所有內容使用繁體中文，條理清晰、語句簡潔。
 """
 
-    model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
-    response = model.generate_content(solution_prompt)
-    solution_text = response.text.strip()
+    return cached_generate(MODEL_NAME, solution_prompt, lambda: generate_text(solution_prompt, MODEL_NAME)).strip()
+
+class SpeculativeSolution:
+    """
+    存在每個使用者 session 的 gr.State 中：考卷一完成就在背景產生詳解 PDF，
+    按下「生成詳解」時若考卷內容沒變就直接取用。重新生成考卷時呼叫 cancel()，
+    尚未開始的工作直接取消，已送出的請求完成後也不再產生 PDF。
+    """
+
+    def __init__(self, exam_text: str):
+        self.exam_text = exam_text
+        self.cancelled = threading.Event()
+        self.future = solution_executor.submit(self._run)
+
+    def _run(self):
+        if self.cancelled.is_set():
+            return None
+        solution_text = build_solution_text(self.exam_text)
+        if self.cancelled.is_set():
+            return None
+        return generate_pdf(solution_text)
+
+    def matches(self, exam_text: str) -> bool:
+        return (
+            not self.cancelled.is_set()
+            and not self.future.cancelled()
+            and self.exam_text == exam_text.strip()
+        )
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+def generate_solution_pdf(question_text: str, speculative: SpeculativeSolution = None) -> str:
+    if not question_text.strip():
+        return "錯誤：沒有可產生詳解的題目內容", None
 
-    return generate_pdf(solution_text)
+    if speculative is not None and speculative.matches(question_text):
+        try:
+            pdf_path = speculative.future.result()
+        except (Exception, CancelledError) as e:
+            # 背景工作失敗（例如暫時的 500）不保留失敗結果，改為當場重新產生
+            print(f"背景詳解失敗，改為重新產生：{e!r}")
+            pdf_path = None
+        if pdf_path is not None:
+            return pdf_path
+
+    return generate_pdf(build_solution_text(question_text))
+
+def on_csv_upload(csv_file):
+    """上傳時就解析並驗證 CSV，之後各按鈕直接使用快取的 DataFrame。"""
+    if csv_file is None:
+        return ""
+    try:
+        df = load_answer_frame(csv_file.name)
+    except ValueError as e:
+        return f"⚠️ {e}"
+    return f"✅ 已載入 {len(df)} 題、{len(student_columns(df))} 位學生的答題資料"
+
+def build_exam_prompt(df, student_name, theme, num_tf, num_mc, num_app, theme_info) -> str:
+    profile = build_student_profile(df, student_name)
+    return f"""以下是「{student_name}」的答題摘要與全班易錯題目：\n{profile}\n請依照以下規則產題：\n{generate_prompt(student_name, theme, num_tf, num_mc, num_app, theme_info)}"""
+
+def gradio_handler(csv_file, student_name, theme, num_tf, num_mc, num_app, speculative=None, regenerate=True):
+    """
+    產生考卷。串流模式下為產生器：模型每送來一段文字就更新 output_text，
+    同時解析並排版 PDF，生成完畢後只需輸出檔案；開啟 SPECULATIVE_SOLUTION 時同時在背景產生詳解。
+    考卷是創作型的輸出，regenerate=True（預設）時每次都重新請模型出題，不沿用快取中相同條件的考卷。
+    """
+    # 舊考卷的詳解已經用不到
+    if speculative is not None:
+        speculative.cancel()
+        speculative = None
 
-def gradio_handler(csv_file, student_name, theme, num_tf, num_mc, num_app):
     if csv_file is not None:
-        df = pd.read_csv(csv_file.name)
+        try:
+            df = load_answer_frame(csv_file.name)
+        except ValueError as e:
+            yield str(e), None, None
+            return
         if student_name not in df.columns:
-            return f"找不到名字：{student_name}，請確認是否正確輸入。", None
+            yield f"找不到名字：{student_name}，請確認是否正確輸入。", None, None
+            return
 
         theme_info = search_theme_info(theme)
-        df_preview = df.head(30)
-        csv_preview = df_preview.to_csv(index=False)
-
-        prompt = f"""以下是學生答題資料（前30筆，包含「{student_name}」）：\n{csv_preview}\n請依照以下規則產題：\n{generate_prompt(student_name, theme, num_tf, num_mc, num_app, theme_info)}"""
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        pdf_path = generate_pdf(response_text)
-        return response_text, pdf_path
+        prompt = build_exam_prompt(df, student_name, theme, num_tf, num_mc, num_app, theme_info)
+        pdf_path = None
+        if STREAM_OUTPUT and PROGRESSIVE_PDF and find_chinese_font():
+            for response_text, pdf_path in stream_exam_with_layout(prompt, regenerate):
+                if pdf_path is None:
+                    yield response_text, None, None
+        elif STREAM_OUTPUT:
+            response_text = ""
+            for piece in cached_generate_stream(MODEL_NAME, prompt, lambda: stream_text(prompt, MODEL_NAME), refresh=regenerate):
+                response_text += piece
+                yield response_text, None, None
+            response_text = response_text.strip()
+        else:
+            response_text = cached_generate(
+                MODEL_NAME, prompt, lambda: generate_text(prompt, MODEL_NAME), refresh=regenerate
+            ).strip()
+        if SPECULATIVE_SOLUTION and response_text:
+            speculative = SpeculativeSolution(response_text)
+        if pdf_path is None:
+            pdf_path = generate_pdf(response_text)
+        yield response_text, pdf_path, speculative
     else:
+        yield "請上傳包含答題資料的 CSV 檔案", None, None
+
+def generate_student_exam(df, student_name, theme, num_tf, num_mc, num_app, theme_info, limiter, out_dir) -> dict:
+    """批次模式中產生單一學生的考卷與 PDF，回傳該生的耗時與 token 紀錄。"""
+    started = time.perf_counter()
+    prompt = build_exam_prompt(df, student_name, theme, num_tf, num_mc, num_app, theme_info)
+    usage = {}
+
+    def call():
+        # 快取命中時不佔用限流額度
+        limiter.acquire()
+        response = generate(prompt, MODEL_NAME)
+        usage["prompt_tokens"] = getattr(response.usage_metadata, "prompt_token_count", None)
+        return response.text or ""
+
+    record = {"學生": student_name, "估計 prompt tokens": estimate_tokens(prompt)}
+    try:
+        text = cached_generate(MODEL_NAME, prompt, call).strip()
+        model_seconds = time.perf_counter() - started
+        if not find_chinese_font():
+            raise FileNotFoundError(FONT_MISSING_MESSAGE)
+        rendered = get_pdf_pool().render("exam", os.path.join(out_dir, f"{student_name}.pdf"), text=text)
+        record.update({
+            "狀態": "完成",
+            "pdf": rendered["path"],
+            "實際 prompt tokens": usage.get("prompt_tokens"),
+            "估計輸出 tokens": estimate_tokens(text),
+            "模型秒數": round(model_seconds, 2),
+            "PDF 排隊秒數": rendered["queue_seconds"],
+            "PDF 產生秒數": rendered["render_seconds"],
+        })
+    except Exception as e:
+        record.update({"狀態": f"失敗：{e}", "pdf": None})
+    record["總秒數"] = round(time.perf_counter() - started, 2)
+    return record
+
+def generate_class_exams(csv_file, theme, num_tf, num_mc, num_app):
+    """
+    全班批次生成：以 BATCH_WORKERS 個執行緒、每分鐘最多 BATCH_RPM 個請求，
+    為 CSV 中每位學生各產生一份考卷，打包成一個 zip（含每位學生的耗時與 token 報表）。
+    """
+    if csv_file is None:
         return "請上傳包含答題資料的 CSV 檔案", None
+    try:
+        df = load_answer_frame(csv_file.name)
+    except ValueError as e:
+        return str(e), None
+
+    students = student_columns(df)
+    theme_info = search_theme_info(theme)
+    limiter = TokenBucket(BATCH_RPM)
+    out_dir = f"class_exams_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(out_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    records = []
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        futures = [
+            executor.submit(generate_student_exam, df, name, theme, num_tf, num_mc, num_app, theme_info, limiter, out_dir)
+            for name in students
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            print(f"[{len(records)}/{len(students)}] {record['學生']}：{record['狀態']}（{record['總秒數']} 秒）")
+    elapsed = time.perf_counter() - started
+
+    report = pd.DataFrame(records).set_index("學生").reindex(students).reset_index()
+    report_path = os.path.join(out_dir, "report.csv")
+    report.drop(columns="pdf").to_csv(report_path, index=False, encoding="utf-8-sig")
+
+    zip_path = f"{out_dir}.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for pdf_path in report["pdf"].dropna():
+            archive.write(pdf_path, os.path.basename(pdf_path))
+        archive.write(report_path, "report.csv")
+
+    done = int((report["狀態"] == "完成").sum())
+    rate = f"每分鐘最多 {BATCH_RPM:g} 個請求" if BATCH_RPM > 0 else "不限流"
+    summary = [
+        f"完成 {done} / {len(students)} 位學生，總耗時 {elapsed:.1f} 秒（{BATCH_WORKERS} 個工作執行緒，{rate}）",
+        f"估計 prompt tokens 合計 {int(report['估計 prompt tokens'].sum())}",
+    ]
+    if "實際 prompt tokens" in report and report["實際 prompt tokens"].notna().any():
+        summary.append(f"模型回報 prompt tokens 合計 {int(report['實際 prompt tokens'].sum())}")
+    summary.append(report.drop(columns="pdf").to_string(index=False))
+    return "\n".join(summary), zip_path
 
 def generate_feedback_handler(csv_file, student_name):
     if csv_file is not None:
-        df = pd.read_csv(csv_file.name)
+        try:
+            df = load_answer_frame(csv_file.name)
+        except ValueError as e:
+            return str(e)
         if student_name not in df.columns:
             return f"找不到名字：{student_name}，請確認是否正確輸入。"
         if "題目" not in df.columns:
@@ -192,55 +367,126 @@ def generate_feedback_handler(csv_file, student_name):
         wrong_text = "\n".join([f"{i+1}. {q}" for i, q in enumerate(wrong_questions["題目"])])
         feedback_prompt = f"""你是一名有經驗的數學老師，以下是學生「{student_name}」在數學測驗中的錯題內容：\n\n{wrong_text}\n\n請根據上述錯題，進行以下三點的分析與建議，務必簡潔有力（使用繁體中文）：\n\n1. 分析這些錯題的共通點或主題\n2. 推測可能的錯誤原因\n3. 提供具體、可執行的學習建議"""
 
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
-        response = model.generate_content(feedback_prompt)
-        return response.text.strip()
+        return cached_generate(MODEL_NAME, feedback_prompt, lambda: generate_text(feedback_prompt, MODEL_NAME)).strip()
     else:
         return "請上傳包含答題資料的 CSV 檔案"
 
-# ✅ Gradio UI
-with gr.Blocks() as demo:
-    gr.Markdown("# 📊 錯題分析與考卷生成系統")
-
-    with gr.Row():
-        csv_input = gr.File(label="上傳 CSV 檔案")
-        student_name_input = gr.Textbox(label="請輸入你的姓名", value="張智翔")
-        theme_input = gr.Textbox(label="請輸入題目主題", value="海綿寶寶")
-
-    with gr.Row():
-        num_tf = gr.Slider(1, 10, value=1, step=1, label="是非題數")
-        num_mc = gr.Slider(1, 10, value=1, step=1, label="選擇題數")
-        num_app = gr.Slider(1, 10, value=1, step=1, label="應用題數")
-
-    output_text = gr.Textbox(label="生成題目內容", lines=15, interactive=False)
-    output_pdf = gr.File(label="下載 PDF 考卷")
-    submit_button = gr.Button("✏️ 生成考卷")
-
-    submit_button.click(
-        fn=gradio_handler,
-        inputs=[csv_input, student_name_input, theme_input, num_tf, num_mc, num_app],
-        outputs=[output_text, output_pdf]
-    )
-
-    with gr.Row():
-        solution_pdf_output = gr.File(label="下載詳解 PDF")
-        generate_solution_button = gr.Button("📘 生成詳解")
-
-    generate_solution_button.click(
-        fn=generate_solution_pdf,
-        inputs=[output_text],
-        outputs=solution_pdf_output
-    )
-
-    gr.Markdown("---")
-
-    feedback_button = gr.Button("📋 生成報表")
-    feedback_output = gr.Textbox(label="報表建議回饋", lines=10, interactive=False)
-
-    feedback_button.click(
-        fn=generate_feedback_handler,
-        inputs=[csv_input, student_name_input],
-        outputs=feedback_output
-    )
-
-demo.launch()
+async def gradio_handler_async(csv_file, student_name, theme, num_tf, num_mc, num_app, speculative=None, regenerate=True):
+    """
+    gradio_handler 的非同步版本：每一步（搜尋、模型串流、PDF）都在執行緒中進行，
+    等待 Gemini 時事件迴圈可以繼續服務其他使用者。
+    """
+    updates = gradio_handler(csv_file, student_name, theme, num_tf, num_mc, num_app, speculative, regenerate)
+    done = object()
+    while True:
+        update = await asyncio.to_thread(next, updates, done)
+        if update is done:
+            return
+        yield update
+
+async def generate_solution_pdf_async(question_text: str, speculative: SpeculativeSolution = None) -> str:
+    # 背景詳解已在進行時直接等待它的結果，不佔用執行緒
+    if speculative is not None and speculative.matches(question_text):
+        try:
+            pdf_path = await asyncio.wrap_future(speculative.future)
+        except Exception as e:
+            print(f"背景詳解失敗，改為重新產生：{e!r}")
+            pdf_path = None
+        if pdf_path is not None:
+            return pdf_path
+    return await asyncio.to_thread(generate_solution_pdf, question_text)
+
+async def generate_feedback_handler_async(csv_file, student_name):
+    return await asyncio.to_thread(generate_feedback_handler, csv_file, student_name)
+
+def build_demo():
+    """
+    建立 Gradio 介面。PDF 工作行程以 spawn 建立時會以 __mp_main__ 重新匯入本檔，
+    介面（以及 gradio 本身）只在真正提供服務的行程中載入，工作行程不必各自佔用這些記憶體。
+    """
+    import gradio as gr
+
+    def prefetch_theme(theme, request: gr.Request):
+        # 以瀏覽器 session 區分 debounce，不同老師同時輸入主題時互不影響
+        theme_cache.prefetch(theme, session=request.session_hash if request else None)
+
+    # ✅ Gradio UI
+    with gr.Blocks() as demo:
+        gr.Markdown("# 📊 錯題分析與考卷生成系統")
+
+        with gr.Row():
+            csv_input = gr.File(label="上傳 CSV 檔案")
+            student_name_input = gr.Textbox(label="請輸入你的姓名", value="張智翔")
+            theme_input = gr.Textbox(label="請輸入題目主題", value="海綿寶寶")
+
+        # 主題停止輸入後先在背景搜尋，按下生成時不必再等待
+        theme_input.change(fn=prefetch_theme, inputs=theme_input, outputs=None)
+        demo.load(fn=prefetch_theme, inputs=theme_input, outputs=None)
+
+        upload_status = gr.Markdown()
+        csv_input.upload(fn=on_csv_upload, inputs=csv_input, outputs=upload_status)
+
+        with gr.Row():
+            num_tf = gr.Slider(1, 10, value=1, step=1, label="是非題數")
+            num_mc = gr.Slider(1, 10, value=1, step=1, label="選擇題數")
+            num_app = gr.Slider(1, 10, value=1, step=1, label="應用題數")
+
+        output_text = gr.Textbox(label="生成題目內容", lines=15, interactive=False)
+        output_pdf = gr.File(label="下載 PDF 考卷")
+        speculative_solution = gr.State(None)
+        # 取消勾選時，相同學生、主題與題數直接沿用快取中的上一份考卷（例如程式中斷後重跑）
+        regenerate_input = gr.Checkbox(label="重新生成（不沿用相同條件的上一份考卷）", value=True)
+        submit_button = gr.Button("✏️ 生成考卷")
+
+        submit_button.click(
+            fn=gradio_handler_async if ASYNC_HANDLERS else gradio_handler,
+            inputs=[csv_input, student_name_input, theme_input, num_tf, num_mc, num_app, speculative_solution, regenerate_input],
+            outputs=[output_text, output_pdf, speculative_solution],
+            concurrency_limit=EXAM_CONCURRENCY
+        )
+
+        with gr.Row():
+            batch_button = gr.Button("📦 全班批次生成")
+            batch_zip_output = gr.File(label="下載全班考卷 zip")
+        batch_report = gr.Textbox(label="批次生成報表", lines=10, interactive=False)
+
+        batch_button.click(
+            fn=generate_class_exams,
+            inputs=[csv_input, theme_input, num_tf, num_mc, num_app],
+            outputs=[batch_report, batch_zip_output],
+            concurrency_limit=BATCH_CONCURRENCY
+        )
+
+        with gr.Row():
+            solution_pdf_output = gr.File(label="下載詳解 PDF")
+            generate_solution_button = gr.Button("📘 生成詳解")
+
+        generate_solution_button.click(
+            fn=generate_solution_pdf_async if ASYNC_HANDLERS else generate_solution_pdf,
+            inputs=[output_text, speculative_solution],
+            outputs=solution_pdf_output,
+            concurrency_limit=SOLUTION_CONCURRENCY
+        )
+
+        gr.Markdown("---")
+
+        feedback_button = gr.Button("📋 生成報表")
+        feedback_output = gr.Textbox(label="報表建議回饋", lines=10, interactive=False)
+
+        feedback_button.click(
+            fn=generate_feedback_handler_async if ASYNC_HANDLERS else generate_feedback_handler,
+            inputs=[csv_input, student_name_input],
+            outputs=feedback_output,
+            concurrency_limit=FEEDBACK_CONCURRENCY
+        )
+
+    demo.queue(max_size=QUEUE_SIZE)
+    return demo
+
+if __name__ != "__mp_main__":
+    demo = build_demo()
+
+# PDF 工作行程以 spawn 建立時會重新匯入本檔，不可在子行程中啟動介面
+if __name__ == "__main__":
+    get_pdf_pool().start()
+    demo.launch()
@@ -0,0 +1,90 @@
+import pandas as pd
+
+from answer_cache import student_columns
+
+# 各段落的上限，讓錯題摘要的長度不隨班級人數與題庫大小成長
+MAX_WRONG_IDS = 40
+MAX_WRONG_DETAILS = 8
+MAX_GROUPS = 10
+HARDEST_K = 8
+STEM_CHARS = 60
+
+
+def class_error_rates(df: pd.DataFrame) -> pd.Series:
+    """每題的全班錯誤率；CSV 沒有「錯誤率」欄位時由作答矩陣計算。"""
+    if "錯誤率" in df.columns:
+        rates = pd.to_numeric(df["錯誤率"], errors="coerce")
+        if rates.notna().all():
+            return rates
+    answers = df[student_columns(df)].astype("float32")
+    return 1 - answers.mean(axis=1)
+
+
+def _group_rates(df: pd.DataFrame, wrong: pd.Series, answered: pd.Series, class_rates: pd.Series, column: str) -> pd.DataFrame:
+    """依 column（單元或題型）分組，比較學生錯誤率與全班平均錯誤率。"""
+    groups = pd.DataFrame({
+        "key": df[column].astype(str).values,
+        "wrong": wrong.values,
+        "answered": answered.values,
+        "class_rate": class_rates.values,
+    }).groupby("key", observed=True).agg(
+        wrong=("wrong", "sum"), answered=("answered", "sum"), class_rate=("class_rate", "mean")
+    )
+    groups = groups[groups["answered"] > 0]
+    groups["student_rate"] = groups["wrong"] / groups["answered"]
+    groups["gap"] = groups["student_rate"] - groups["class_rate"]
+    return groups.sort_values("gap", ascending=False).head(MAX_GROUPS)
+
+
+def _stem(text) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= STEM_CHARS else text[:STEM_CHARS] + "…"
+
+
+def build_student_profile(df: pd.DataFrame, student_name: str) -> str:
+    """
+    把答題矩陣濃縮成單一學生的錯題摘要，取代把整份 CSV 貼進 prompt：
+      - 答錯的題號（以及其中全班較少人錯的幾題題目內容）；
+      - 各單元、各題型的錯誤率與全班平均比較；
+      - 全班最容易錯的題目。
+    每一段都有上限，prompt 長度不會隨班級人數或題庫大小增加。
+    """
+    answers = pd.to_numeric(df[student_name], errors="coerce")
+    answered = answers.notna()
+    wrong = answers == 0
+    class_rates = class_error_rates(df)
+    ids = df["題號"].astype(str) if "題號" in df.columns else pd.Series(df.index.astype(str), index=df.index)
+
+    wrong_ids = ids[wrong].tolist()
+    student_rate = wrong.sum() / max(answered.sum(), 1)
+    lines = [
+        f"【{student_name} 錯題摘要】作答 {int(answered.sum())} 題，答錯 {int(wrong.sum())} 題，"
+        f"錯誤率 {student_rate:.0%}（全班平均 {class_rates.mean():.0%}）",
+    ]
+    if wrong_ids:
+        shown = "、".join(wrong_ids[:MAX_WRONG_IDS])
+        more = f" 等共 {len(wrong_ids)} 題" if len(wrong_ids) > MAX_WRONG_IDS else ""
+        lines.append(f"答錯題號：{shown}{more}")
+
+    if "題目" in df.columns and wrong.any():
+        # 全班多數人答對、該生卻答錯的題目最能反映個人弱點
+        unexpected = class_rates[wrong].sort_values().head(MAX_WRONG_DETAILS).index
+        lines.append("答錯且全班錯誤率較低的題目：")
+        for idx in unexpected:
+            lines.append(f"- 第{ids[idx]}題（全班錯誤率 {class_rates[idx]:.0%}）：{_stem(df.at[idx, '題目'])}")
+
+    for column in ("單元", "題型"):
+        if column not in df.columns:
+            continue
+        groups = _group_rates(df, wrong, answered, class_rates, column)
+        lines.append(f"各{column}錯誤率（該生 / 全班）：")
+        for key, row in groups.iterrows():
+            lines.append(f"- {key}：{row['student_rate']:.0%} / {row['class_rate']:.0%}（錯 {int(row['wrong'])} / {int(row['answered'])} 題）")
+
+    hardest = class_rates.sort_values(ascending=False).head(HARDEST_K).index
+    lines.append("全班最易錯題目：")
+    for idx in hardest:
+        stem = f"：{_stem(df.at[idx, '題目'])}" if "題目" in df.columns else ""
+        mark = "（該生答錯）" if wrong[idx] else ""
+        lines.append(f"- 第{ids[idx]}題 錯誤率 {class_rates[idx]:.0%}{mark}{stem}")
+    return "\n".join(lines)
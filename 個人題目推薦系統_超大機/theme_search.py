@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def duckduckgo_backend(theme: str, max_results: int) -> list:
+    """以 DuckDuckGo 搜尋主題，回傳含 title、body 的結果清單。"""
+    from duckduckgo_search import DDGS
+
+    with DDGS() as ddgs:
+        return list(ddgs.text(theme, max_results=max_results))
+
+
+def stub_backend(theme: str, max_results: int) -> list:
+    """離線測試用的假搜尋結果，不需要網路。"""
+    return [
+        {"title": f"{theme} 相關資料 {i + 1}", "body": f"這是關於「{theme}」的第 {i + 1} 筆離線測試資料。"}
+        for i in range(max_results)
+    ]
+
+
+BACKENDS = {
+    "duckduckgo": duckduckgo_backend,
+    "stub": stub_backend,
+}
+
+
+class ThemeSearchCache:
+    """
+    主題搜尋結果的 TTL 快取：同一主題在 ttl_seconds 內只搜尋一次，最多保留 max_items 個主題。
+    prefetch() 會在背景執行緒先行搜尋，之後 get() 直接取用或等待進行中的搜尋，
+    不會對同一主題重複送出查詢。搜尋失敗不寫入快取。
+    """
+
+    def __init__(self, backend, ttl_seconds=3600, max_items=128, debounce_seconds=0.8):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.debounce_seconds = debounce_seconds
+        self.results = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        # 每個瀏覽器 session 各自一個 debounce 計時器，多位老師同時輸入時不會互相取消
+        self._timers = {}
+
+    @staticmethod
+    def _key(theme: str, max_results: int):
+        return " ".join(theme.split()), max_results
+
+    def _search(self, key):
+        try:
+            results = self.backend(key[0], key[1])
+        except Exception as e:
+            print(f"主題搜尋失敗：{e}")
+            results = None
+        with self.lock:
+            self.pending.pop(key, None)
+            if results is not None:
+                self.results[key] = (time.monotonic(), results)
+                # 超過上限時刪除最早搜尋的主題
+                while len(self.results) > self.max_items:
+                    oldest = min(self.results, key=lambda k: self.results[k][0])
+                    del self.results[oldest]
+        return results or []
+
+    def _lookup_or_submit(self, key):
+        """回傳 (快取結果, None) 或 (None, 進行中的 future)。"""
+        with self.lock:
+            cached = self.results.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+                return cached[1], None
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._search, key)
+                self.pending[key] = future
+            return None, future
+
+    def get(self, theme: str, max_results: int = 3) -> list:
+        results, future = self._lookup_or_submit(self._key(theme, max_results))
+        if future is not None:
+            results = future.result()
+        return results
+
+    def _fire(self, session, key):
+        with self.lock:
+            if self._timers.get(session) is threading.current_thread():
+                del self._timers[session]
+        self._lookup_or_submit(key)
+
+    def prefetch(self, theme: str, max_results: int = 3, session=None):
+        """
+        主題輸入框變動時呼叫；同一個 session 停止輸入 debounce_seconds 秒後才在背景搜尋。
+        session 為呼叫端的識別（例如 Gradio 的 session_hash），只會取消同一個 session 尚未送出的搜尋。
+        """
+        if not theme or not theme.strip():
+            return
+        key = self._key(theme, max_results)
+        with self.lock:
+            timer = self._timers.get(session)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.debounce_seconds, self._fire, args=(session, key))
+            timer.daemon = True
+            self._timers[session] = timer
+            timer.start()
+
+
+theme_cache = ThemeSearchCache(
+    BACKENDS[os.environ.get("THEME_SEARCH_BACKEND", "duckduckgo")],
+    ttl_seconds=float(os.environ.get("THEME_SEARCH_TTL", 3600)),
+)
@@ -1,14 +1,30 @@
 import os
 import json
-import time
+import argparse
+import unicodedata
 import pandas as pd
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from google import genai
+
+# 共用模組放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import cached_generate
+from gemini_client import call_with_backoff, get_client, model_name
+from rate_limit import TokenBucket
+from token_budget import estimate_tokens, pack_by_budget, TokenReport
+from college_trie import FastPathClassifier
 
 # 載入 .env 中的 GEMINI_API_KEY
 load_dotenv()
 
+MODEL_NAME = model_name("classify")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 每個實際送出的請求的估計 token 數與模型回報的 prompt tokens
+token_report = TokenReport()
+
 # 定義評分項目（依據原始 xlsx 編碼規則）
 ITEMS = [
     "教育學院",
@@ -23,14 +39,9 @@ ITEMS = [
     "其他"
 ]
 
-def parse_response(response_text):
-    """
-    嘗試解析 Gemini API 回傳的 JSON 格式結果。
-    如果回傳內容被 markdown 的反引號包圍，則先移除這些標記。
-    若解析失敗，則回傳所有項目皆為空的字典。
-    """
+def strip_code_fence(response_text: str) -> str:
+    """如果回傳內容以三個反引號開始，則移除第一行和最後一行。"""
     cleaned = response_text.strip()
-    # 如果回傳內容以三個反引號開始，則移除第一行和最後一行
     if cleaned.startswith("```"):
         lines = cleaned.splitlines()
         if lines[0].startswith("```"):
@@ -38,6 +49,15 @@ def parse_response(response_text):
         if lines and lines[-1].strip() == "```":
             lines = lines[:-1]
         cleaned = "\n".join(lines).strip()
+    return cleaned
+
+def parse_response(response_text):
+    """
+    嘗試解析 Gemini API 回傳的 JSON 格式結果。
+    如果回傳內容被 markdown 的反引號包圍，則先移除這些標記。
+    若解析失敗，則回傳所有項目皆為空的字典。
+    """
+    cleaned = strip_code_fence(response_text)
     
     try:
         result = json.loads(cleaned)
@@ -50,6 +70,48 @@ def parse_response(response_text):
         print("原始回傳內容：", response_text)
         return {item: "" for item in ITEMS}
 
+def empty_result() -> dict:
+    return {item: "" for item in ITEMS}
+
+def is_empty_result(result: dict) -> bool:
+    """所有項目皆為空，代表解析失敗或 API 呼叫失敗的補值結果。"""
+    return all(not str(result.get(item, "")).strip() for item in ITEMS)
+
+def normalize_department(name) -> str:
+    """全形半形統一（NFKC）並移除所有空白，讓同一系所的不同寫法對應到同一個鍵。"""
+    return "".join(unicodedata.normalize("NFKC", str(name)).split())
+
+class DepartmentMemo:
+    """
+    系所名稱 → 分類結果 的永久字典，以 JSON 檔保存，之後的執行會沿用。
+    只保存非空的分類結果，失敗的系所下次執行會重新分類。
+    """
+
+    def __init__(self, path="department_memo.json"):
+        self.path = path
+        self.mapping = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.mapping = json.load(f)
+
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def get(self, key):
+        return self.mapping.get(key)
+
+    def update(self, keys, results):
+        for key, result in zip(keys, results):
+            if not is_empty_result(result):
+                self.mapping[key] = result
+
+    def save(self):
+        # 先寫入暫存檔再取代，避免中斷時留下寫一半的字典
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.mapping, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
 def select_dialogue_column(chunk: pd.DataFrame) -> str:
     """
     根據 CSV 欄位內容自動選取存放逐字稿的欄位。
@@ -63,7 +125,18 @@ def select_dialogue_column(chunk: pd.DataFrame) -> str:
     print("CSV 欄位：", list(chunk.columns))
     return chunk.columns[0]
 
-def process_batch_dialogue(client, dialogues: list, delimiter="-----"):
+def generate_text(client, content, limiter=None):
+    """呼叫 Gemini 取得回覆文字；有 limiter 時每次實際送出請求前先取得令牌。"""
+    def request():
+        if limiter is not None:
+            limiter.acquire()
+        response = client.models.generate_content(model=MODEL_NAME, contents=content)
+        usage = getattr(response, "usage_metadata", None)
+        token_report.record("Gemini 請求", estimate_tokens(content), getattr(usage, "prompt_token_count", None))
+        return response.text
+    return call_with_backoff(request)
+
+def process_batch_dialogue(client, dialogues: list, delimiter="-----", limiter=None):
     """
     將多筆逐字稿合併成一個批次請求。
     提示中要求模型對每筆逐字稿產生 JSON 格式回覆，
@@ -85,16 +158,14 @@ def process_batch_dialogue(client, dialogues: list, delimiter="-----"):
     content = prompt + "\n\n" + batch_text
 
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=content
-        )
+        # 相同批次重跑時直接使用快取，不再重複呼叫 API
+        response_text = cached_generate(MODEL_NAME, content, lambda: generate_text(client, content, limiter))
     except:
         print(f"API 呼叫失敗111111111111111111111111111111111111111111")
-        return [{item: "" for item in ITEMS} for _ in dialogues]
+        return [empty_result() for _ in dialogues]
     
-    print("批次 API 回傳內容：", response.text)
-    parts = response.text.split(delimiter)
+    print("批次 API 回傳內容：", response_text)
+    parts = response_text.split(delimiter)
     results = []
     for part in parts:
         part = part.strip()
@@ -104,47 +175,382 @@ def process_batch_dialogue(client, dialogues: list, delimiter="-----"):
     if len(results) > len(dialogues):
         results = results[:len(dialogues)]
     elif len(results) < len(dialogues):
-        results.extend([{item: "" for item in ITEMS}] * (len(dialogues) - len(results)))
+        results.extend([empty_result() for _ in range(len(dialogues) - len(results))])
     return results
 
+def build_structured_prompt(dialogues: list) -> str:
+    """要求模型回傳以 index 對應每筆資料的 JSON 陣列。"""
+    records = "\n".join(f"[{idx}] {dialogue}" for idx, dialogue in enumerate(dialogues))
+    example = "{\"index\": 0, " + ", ".join(f"\"{item}\": \"\"" for item in ITEMS) + "}"
+    return (
+        "你是大學的系所分類大師，請根據以下編碼規則評估所屬系所為哪個學院\n"
+        + "\n".join(ITEMS) +
+        "\n\n請依據評估結果，對每個項目：若觸及則標記為 \"1\"，否則留空，若無法判斷請於「其他」欄位標註為 \"1\"。\n"
+        "請只回傳一個 JSON 陣列，每筆資料對應一個物件，並以 \"index\" 欄位填入該筆資料前方方括號中的編號，"
+        "不要輸出其他文字。物件格式如下：\n"
+        f"{example}\n\n"
+        f"以下共 {len(dialogues)} 筆資料：\n{records}"
+    )
+
+def parse_structured_response(response_text: str, count: int) -> dict:
+    """
+    解析 JSON 陣列，回傳 {index: 結果}；只保留 index 合法且為物件的項目，
+    缺少的項目由呼叫端重新送出。整段無法解析時回傳空字典。
+    """
+    try:
+        data = json.loads(strip_code_fence(response_text))
+    except Exception as e:
+        print(f"解析 JSON 陣列失敗：{e}")
+        return {}
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        return {}
+    parsed = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            idx = int(entry.get("index"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < count and idx not in parsed:
+            parsed[idx] = {item: str(entry.get(item, "") or "").strip() for item in ITEMS}
+    return parsed
+
+def request_structured(client, dialogues: list, limiter=None) -> dict:
+    """送出一次結構化請求並解析；API 呼叫失敗時回傳空字典，讓所有項目進入修補流程。"""
+    content = build_structured_prompt(dialogues)
+    try:
+        response_text = cached_generate(MODEL_NAME, content, lambda: generate_text(client, content, limiter))
+    except Exception as e:
+        print(f"API 呼叫失敗：{e}")
+        return {}
+    return parse_structured_response(response_text, len(dialogues))
+
+def process_batch_structured(client, dialogues: list, limiter=None, repair_rounds=2):
+    """
+    結構化模式：模型回傳以 index 對應的 JSON 陣列，因此缺漏或多出的項目不會錯位。
+    缺少或無法解析的項目只把那幾筆切成更小的批次重新送出（最多 repair_rounds 輪），
+    不必整批重跑；仍無法取得的項目才以空結果補上。
+    """
+    results = request_structured(client, dialogues, limiter)
+    missing = [idx for idx in range(len(dialogues)) if idx not in results]
+    for round_no in range(repair_rounds):
+        if not missing:
+            break
+        print(f"第 {round_no + 1} 輪修補：重新送出 {len(missing)} 筆缺漏資料")
+        # 每輪把批次切小一半，降低再次缺漏的機率
+        size = max(1, (len(missing) + 1) // 2)
+        still_missing = []
+        for start in range(0, len(missing), size):
+            subset = missing[start:start + size]
+            repaired = request_structured(client, [dialogues[idx] for idx in subset], limiter)
+            for local_idx, idx in enumerate(subset):
+                if local_idx in repaired:
+                    results[idx] = repaired[local_idx]
+                else:
+                    still_missing.append(idx)
+        missing = still_missing
+    if missing:
+        print(f"仍有 {len(missing)} 筆無法取得分類結果，以空結果補上")
+    return [results.get(idx, empty_result()) for idx in range(len(dialogues))]
+
+def plan_batches(keys: list, memo, batch_size=10, start_row=0, token_budget=0, overhead=0):
+    """
+    從 start_row 開始依列順序切出連續的列範圍，每個範圍最多包含 batch_size 個
+    「第一次出現且不在 memo 中」的鍵，產生 (start_idx, end_idx, new_keys)。
+    範圍內其他列的鍵不是已在 memo 中，就是在更前面的批次已送出分類，
+    因此每個不同的系所只會送出一次。
+    token_budget > 0 時，另外限制每批的估計 token 數（overhead + 各鍵）不超過預算。
+    """
+    seen = set()
+    start_idx = start_row
+    new_keys = []
+    used = overhead
+    for idx in range(start_row, len(keys)):
+        key = keys[idx]
+        if key in memo or key in seen:
+            continue
+        cost = estimate_tokens(key) + 2
+        over_budget = token_budget > 0 and used + cost > token_budget
+        if new_keys and (len(new_keys) == batch_size or over_budget):
+            yield start_idx, idx, new_keys
+            start_idx, new_keys, used = idx, [], overhead
+        seen.add(key)
+        new_keys.append(key)
+        used += cost
+    if start_idx < len(keys):
+        yield start_idx, len(keys), new_keys
+
+class Checkpoint:
+    """
+    記錄已完成並寫入輸出檔的列範圍（JSON 檔），中斷後可從第一個未完成的批次繼續。
+    輸出檔依輸入順序逐批寫入，因此已完成的範圍必定是從第 0 列開始的連續區段。
+    """
+
+    def __init__(self, path, input_csv, total):
+        self.path = path
+        self.input_csv = os.path.abspath(input_csv)
+        self.total = total
+        self.done_ranges = []
+
+    @property
+    def next_row(self) -> int:
+        next_row = 0
+        for start_idx, end_idx in sorted(self.done_ranges):
+            if start_idx != next_row:
+                break
+            next_row = end_idx
+        return next_row
+
+    def load(self) -> bool:
+        """讀取既有檢查點；輸入檔或筆數不同時視為無效，回傳 False。"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("input_csv") != self.input_csv or data.get("total") != self.total:
+            print("檢查點與目前的輸入檔不符，將從頭開始。")
+            return False
+        self.done_ranges = [tuple(r) for r in data.get("done_ranges", [])]
+        return True
+
+    def mark_done(self, start_idx, end_idx):
+        self.done_ranges.append((start_idx, end_idx))
+        self.save()
+
+    def truncate(self, rows):
+        """只保留前 rows 列以內的已完成範圍。"""
+        self.done_ranges = [(s, e) for s, e in self.done_ranges if e <= rows]
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"input_csv": self.input_csv, "total": self.total, "done_ranges": self.done_ranges}, f)
+        os.replace(tmp_path, self.path)
+
+def validate_output(output_csv, checkpoint: Checkpoint, columns) -> int:
+    """
+    比對輸出檔與檢查點：輸出檔欄位不符或無法讀取時從頭開始；
+    輸出檔列數多於檢查點（寫入後未來得及更新檢查點）或少於檢查點時，
+    以兩者中較少的列數為準，重寫輸出檔並回傳可續跑的起始列。
+    """
+    if not os.path.exists(output_csv):
+        checkpoint.truncate(0)
+        return 0
+    try:
+        written = pd.read_csv(output_csv, dtype=str, keep_default_na=False)
+    except Exception as e:
+        print(f"無法讀取既有輸出檔：{e}，將從頭開始。")
+        checkpoint.truncate(0)
+        return 0
+    if list(written.columns) != list(columns):
+        print("既有輸出檔欄位不符，將從頭開始。")
+        checkpoint.truncate(0)
+        return 0
+    checkpoint.truncate(min(len(written), checkpoint.next_row))
+    rows = checkpoint.next_row
+    if rows != len(written):
+        print(f"輸出檔有 {len(written)} 列，檢查點記錄 {rows} 列，保留前 {rows} 列。")
+        written.iloc[:rows].to_csv(output_csv, index=False, encoding="utf-8-sig")
+    return rows
+
+def retry_empty_rows(client, output_csv, dialogue_col, memo, args):
+    """
+    重新分類輸出檔中所有項目皆為空（API 失敗或解析失敗補值）的列，
+    同一系所只送出一次，完成後重寫輸出檔。
+    """
+    written = pd.read_csv(output_csv, dtype=str, keep_default_na=False)
+    empty_rows = [idx for idx, row in written[ITEMS].iterrows() if is_empty_result(row.to_dict())]
+    if not empty_rows:
+        print("沒有需要重跑的空白結果。")
+        return
+    keys = {idx: normalize_department(written.at[idx, dialogue_col]) for idx in empty_rows}
+    pending = sorted({key for key in keys.values() if key not in memo})
+    print(f"共 {len(empty_rows)} 列為空白結果，需重新分類 {len(pending)} 個系所")
+
+    batches = [
+        (start, start + args.batch_size, pending[start:start + args.batch_size])
+        for start in range(0, len(pending), args.batch_size)
+    ]
+    for _, _, records, batch_results in run_batches(
+        client, batches, args.workers, args.rpm, not args.legacy_delimiter
+    ):
+        memo.update(records, batch_results)
+        memo.save()
+
+    recovered = 0
+    for idx, key in keys.items():
+        result = memo.get(key)
+        if result is None:
+            continue
+        for item in ITEMS:
+            written.at[idx, item] = result.get(item, "")
+        recovered += 1
+    written.to_csv(output_csv, index=False, encoding="utf-8-sig")
+    print(f"已補回 {recovered} / {len(empty_rows)} 列")
+
+def run_batches(client, batches: list, workers=4, requests_per_minute=15, structured=True):
+    """
+    以執行緒池同時送出多個 process_batch_dialogue 請求，
+    並以令牌桶限制每分鐘的請求數，配額錯誤時由 call_with_backoff 退避重試。
+    batches 為 (start_idx, end_idx, records) 清單，依輸入順序逐批產生
+    (start_idx, end_idx, records, batch_results)；records 為空的批次不呼叫 API。
+    structured=True 時使用結構化 JSON 與修補流程，否則沿用分隔線格式。
+    同時送出中的批次最多為 workers 的兩倍，避免一次把所有請求排進佇列。
+    """
+    limiter = TokenBucket(requests_per_minute)
+    max_pending = max(1, workers) * 2
+
+    def classify(records):
+        if not records:
+            return []
+        if structured:
+            return process_batch_structured(client, records, limiter=limiter)
+        return process_batch_dialogue(client, records, limiter=limiter)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = []
+        next_submit = 0
+        for index, (start_idx, end_idx, records) in enumerate(batches):
+            while next_submit < len(batches) and next_submit - index < max_pending:
+                futures.append(executor.submit(classify, batches[next_submit][2]))
+                next_submit += 1
+            yield start_idx, end_idx, records, futures[index].result()
+            futures[index] = None
+
+def build_fast_path(rules_path, memo, seed_csvs) -> FastPathClassifier:
+    """以規則檔、永久字典與過去的輸出 CSV 建立本機快速分類器。"""
+    fast_path = FastPathClassifier(ITEMS)
+    if rules_path and os.path.exists(rules_path):
+        fast_path.load_rules(rules_path)
+    for seed_csv in seed_csvs:
+        seed_df = pd.read_csv(seed_csv, dtype=str, keep_default_na=False)
+        if not set(ITEMS) <= set(seed_df.columns):
+            print(f"{seed_csv} 缺少分類欄位，略過")
+            continue
+        seed_col = select_dialogue_column(seed_df)
+        for name, result in zip(seed_df[seed_col], seed_df[ITEMS].to_dict(orient="records")):
+            if not is_empty_result(result):
+                fast_path.add_exact(normalize_department(name), result)
+    for key, result in memo.mapping.items():
+        fast_path.add_exact(key, result)
+    print(f"快速分類器：{fast_path.trie.size} 個關鍵字、{len(fast_path.exact)} 個已知系所")
+    return fast_path
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python RDai.py <path_to_csv>")
-        sys.exit(1)
-    
-    input_csv = sys.argv[1]
-    output_csv = "113_batch.csv"
-    if os.path.exists(output_csv):
-        os.remove(output_csv)
+    parser = argparse.ArgumentParser(description="以 Gemini 將錄取學系分類到學院")
+    parser.add_argument("input_csv", help="輸入 CSV 路徑")
+    parser.add_argument("--output", default="113_batch.csv", help="輸出 CSV 路徑")
+    parser.add_argument("--batch-size", type=int, default=10, help="每個請求最多包含的筆數")
+    parser.add_argument("--token-budget", type=int, default=0, help="每個請求的估計 prompt token 上限（0 表示只依筆數切批）")
+    parser.add_argument("--workers", type=int, default=4, help="同時送出的請求數")
+    parser.add_argument("--rpm", type=float, default=15, help="每分鐘最多請求數（0 表示不限）")
+    parser.add_argument("--memo", default="department_memo.json", help="系所分類永久字典路徑")
+    parser.add_argument("--no-dedup", action="store_true", help="不做系所去重，每一列都送出分類")
+    parser.add_argument("--resume", action="store_true", help="依檢查點從第一個未完成的批次繼續")
+    parser.add_argument("--retry-empty", action="store_true", help="完成後重新分類結果全為空白的列")
+    parser.add_argument("--legacy-delimiter", action="store_true", help="改用分隔線格式的回覆（不做缺漏修補）")
+    parser.add_argument("--rules", default=os.path.join(SCRIPT_DIR, "college_rules.json"), help="關鍵字規則檔")
+    parser.add_argument("--seed", nargs="*", default=[], help="過去的分類結果 CSV，用來建立已知系所對照")
+    parser.add_argument("--no-fast-path", action="store_true", help="不使用本機快速分類，全部交給 LLM")
+    args = parser.parse_args()
     
+    input_csv = args.input_csv
+    output_csv = args.output
     df = pd.read_csv(input_csv)
-    gemini_api_key = os.environ.get("GEMINI_API_KEY")
-    if not gemini_api_key:
-        raise ValueError("請設定環境變數 GEMINI_API_KEY")
-    client = genai.Client(api_key=gemini_api_key)
+    total = len(df)
+    checkpoint = Checkpoint(output_csv + ".checkpoint.json", input_csv, total)
     
     dialogue_col = select_dialogue_column(df)
     print(f"使用欄位作為逐字稿：{dialogue_col}")
     
-    batch_size = 10
-    total = len(df)
-    for start_idx in range(0, total, batch_size):
-        end_idx = min(start_idx + batch_size, total)
-        batch = df.iloc[start_idx:end_idx]
-        dialogues = batch[dialogue_col].tolist()
-        dialogues = [str(d).strip() for d in dialogues]
-        batch_results = process_batch_dialogue(client, dialogues)
-        batch_df = batch.copy()
+    start_row = 0
+    if args.resume and checkpoint.load():
+        start_row = validate_output(output_csv, checkpoint, list(df.columns) + ITEMS)
+        print(f"從第 {start_row} 列繼續（共 {total} 筆）")
+    else:
+        if os.path.exists(output_csv):
+            os.remove(output_csv)
+        checkpoint.save()
+    
+    # 共用的 Client 會保持連線，批次之間不必重新建立 HTTP 連線
+    client = get_client()
+    
+    dialogues = [str(d).strip() for d in df[dialogue_col].tolist()]
+    keys = [normalize_department(d) for d in dialogues]
+    dedup = not args.no_dedup
+    memo = DepartmentMemo(args.memo)
+    
+    # 有把握的系所先在本機分類，只有模稜兩可的才送給 LLM
+    fast = {}
+    if not args.no_fast_path:
+        fast_path = build_fast_path(args.rules, memo, args.seed)
+        for key in dict.fromkeys(keys[start_row:]):
+            if dedup and key in memo:
+                continue
+            result = fast_path.classify(key)
+            if result is not None:
+                fast[key] = result
+        print(fast_path.report())
+    
+    # 提示本身（規則說明與格式範例）的 token 數，每個請求都要付一次
+    overhead = estimate_tokens(build_structured_prompt([]))
+    if dedup:
+        # 每個不同的系所只分類一次，結果再套回所有相同系所的列
+        batches = list(plan_batches(
+            keys, set(memo.mapping) | set(fast), args.batch_size, start_row, args.token_budget, overhead
+        ))
+        resolved = {}
+    else:
+        if args.token_budget > 0:
+            # 已由快速分類處理的列不佔預算
+            texts = ["" if key in fast else dialogue for key, dialogue in zip(keys[start_row:], dialogues[start_row:])]
+            ranges = [
+                (start_row + s, start_row + e)
+                for s, e, _ in pack_by_budget(texts, args.token_budget, overhead, args.batch_size)
+            ]
+        else:
+            ranges = [(start, min(start + args.batch_size, total)) for start in range(start_row, total, args.batch_size)]
+        batches = [
+            (start, end, [dialogues[idx] for idx in range(start, end) if keys[idx] not in fast])
+            for start, end in ranges
+        ]
+    sent = sum(len(records) for _, _, records in batches)
+    print(f"共 {total - start_row} 筆待處理，需送出分類 {sent} 筆")
+    
+    # 批次結果依輸入順序回傳，因此輸出檔的列順序與輸入相同；
+    # 去重模式下，範圍內的鍵不是在本批次就是在更前面已完成的批次（或 memo）中，一定查得到
+    for start_idx, end_idx, records, batch_results in run_batches(
+        client, batches, args.workers, args.rpm, not args.legacy_delimiter
+    ):
+        if dedup:
+            resolved.update(zip(records, batch_results))
+            memo.update(records, batch_results)
+            memo.save()
+            batch_results = [resolved.get(key) or memo.get(key) or fast.get(key) for key in keys[start_idx:end_idx]]
+        else:
+            llm_results = iter(batch_results)
+            batch_results = [fast.get(key) or next(llm_results) for key in keys[start_idx:end_idx]]
+        if records:
+            print(f"批次 {start_idx}-{end_idx}：{len(records)} 筆送出分類，估計 {estimate_tokens(build_structured_prompt(records))} tokens")
+        batch_df = df.iloc[start_idx:end_idx].copy()
         for item in ITEMS:
             batch_df[item] = [res.get(item, "") for res in batch_results]
         if start_idx == 0:
             batch_df.to_csv(output_csv, index=False, encoding="utf-8-sig")
         else:
             batch_df.to_csv(output_csv, mode='a', index=False, header=False, encoding="utf-8-sig")
+        checkpoint.mark_done(start_idx, end_idx)
         print(f"已處理 {end_idx} 筆 / {total}")
-        time.sleep(1)
     
-    print("全部處理完成。最終結果已寫入：", output_csv)
+    if args.retry_empty:
+        retry_empty_rows(client, output_csv, dialogue_col, memo, args)
+    print(token_report.summary())
+    
+    print(f"全部處理完成，共送出 {sent} 筆分類（原始 {total} 筆）。最終結果已寫入：", output_csv)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
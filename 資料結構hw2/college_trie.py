@@ -0,0 +1,92 @@
+import json
+
+
+class KeywordTrie:
+    """
+    關鍵字字典樹：一次走訪字串即可找出所有出現的關鍵字及其標籤，
+    回傳 (起點, 終點, 標籤) 清單。
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def insert(self, keyword: str, label: str):
+        node = self.root
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        if "$" not in node:
+            self.size += 1
+        node["$"] = label
+
+    def find_all(self, text: str) -> list:
+        matches = []
+        for start in range(len(text)):
+            node = self.root
+            for end in range(start, len(text)):
+                node = node.get(text[end])
+                if node is None:
+                    break
+                if "$" in node:
+                    matches.append((start, end + 1, node["$"]))
+        return matches
+
+
+class FastPathClassifier:
+    """
+    在呼叫 LLM 前先在本機分類系所：
+      1. 完全相同的系所名稱直接沿用過去的 LLM 結果；
+      2. 以關鍵字字典樹比對，被較長關鍵字完全涵蓋的短關鍵字不列入，
+         剩下的關鍵字只指向單一學院時才視為有把握，否則交給 LLM。
+    並統計命中率，方便觀察省下多少 API 呼叫。
+    """
+
+    def __init__(self, items: list):
+        self.items = items
+        self.trie = KeywordTrie()
+        self.exact = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load_rules(self, path: str):
+        """規則檔為 {學院: [關鍵字, ...]} 的 JSON。"""
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+        for college, keywords in rules.items():
+            if college not in self.items:
+                print(f"規則檔中的學院「{college}」不在分類項目中，略過")
+                continue
+            for keyword in keywords:
+                self.trie.insert(keyword, college)
+
+    def add_exact(self, key: str, result: dict):
+        """加入過去 LLM 的分類結果（系所名稱需先正規化）。"""
+        self.exact[key] = result
+
+    def _match_college(self, key: str):
+        matches = self.trie.find_all(key)
+        kept = [
+            (start, end, college) for start, end, college in matches
+            if not any(s <= start and end <= e and (s, e) != (start, end) for s, e, _ in matches)
+        ]
+        colleges = {college for _, _, college in kept}
+        if len(colleges) != 1:
+            return None
+        college = colleges.pop()
+        return {item: "1" if item == college else "" for item in self.items}
+
+    def classify(self, key: str):
+        """有把握時回傳分類結果，否則回傳 None。"""
+        result = self.exact.get(key)
+        if result is None:
+            result = self._match_college(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"本機快速分類命中 {self.hits} / {total}（{rate:.1f}%），省下 {self.hits} 筆 API 分類"
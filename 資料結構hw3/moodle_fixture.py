@@ -0,0 +1,87 @@
+import time
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模擬 Moodle 的幾個頁面，網址與選擇器和 playwright_gemini_html.run 使用的相同，
+# 讓整個流程可以離線執行並量測每個步驟的耗時
+SESSION_COOKIE = "MoodleSession=fixture"
+
+PAGES = {
+    "/my/": """
+        <a class="dropdown-toggle icon-no-margin" href="#">頭像</a>
+        <a class="dropdown-item menu-action" href="/my/">儀表板</a>
+        <a href="/course/view.php?id=1"><span class="multiline">1131資料結構</span></a>
+        <a href="/course/view.php?id=2"><span class="multiline">1132程式語言</span></a>
+    """,
+    "/course/view.php": """
+        <a href="/mod/resource/view.php?id=1"><span class="instancename">課程大綱</span></a>
+        <a href="/mod/forum/view.php?id=2"><span class="instancename">公告</span></a>
+    """,
+    "/mod/forum/view.php": """
+        <a class="p-3 p-l-0 w-100 h-100 d-block" href="/mod/forum/discuss.php?d=3">作業三規定</a>
+        <a class="p-3 p-l-0 w-100 h-100 d-block" href="/mod/forum/discuss.php?d=4">作業四規定</a>
+    """,
+    "/mod/forum/discuss.php": """
+        <div id="post-content-643397"><p>作業四：請以 Python 實作堆疊與佇列，並撰寫測試。</p></div>
+    """,
+}
+
+LOGIN_PAGE = """
+    <form method="post" action="/login/index.php">
+        <input id="username" name="username">
+        <input id="password" name="password" type="password">
+        <button type="submit" class="btn btn-primary">登入</button>
+    </form>
+"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # 每個頁面回應前的延遲秒數，模擬網路與伺服器處理時間
+    delay = 0.0
+
+    def _send(self, status, body="", headers=None):
+        data = f"<!DOCTYPE html><html><head><meta charset='UTF-8'></head><body>{body}</body></html>".encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _logged_in(self) -> bool:
+        return SESSION_COOKIE in self.headers.get("Cookie", "")
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        path = urlparse(self.path).path
+        if path == "/login/index.php":
+            self._send(200, LOGIN_PAGE)
+        elif path in PAGES:
+            if self._logged_in():
+                self._send(200, PAGES[path])
+            else:
+                self._send(303, headers={"Location": "/login/index.php"})
+        else:
+            self._send(404, "not found")
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        if form.get("username") and form.get("password"):
+            self._send(303, headers={"Location": "/my/", "Set-Cookie": f"{SESSION_COOKIE}; Path=/"})
+        else:
+            self._send(200, LOGIN_PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server(delay=0.0, port=0):
+    """在背景執行緒啟動測試用的 Moodle 伺服器，回傳 (server, base_url)；用完呼叫 server.shutdown()。"""
+    handler = type("DelayedFixtureHandler", (FixtureHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
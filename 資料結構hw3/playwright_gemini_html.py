@@ -1,8 +1,16 @@
 import os
+import sys
+import time
 import asyncio
+import argparse
+import tempfile
 from dotenv import load_dotenv
 from playwright.async_api import async_playwright
-import google.generativeai as genai
+
+# 共用模組放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gemini_client import generate_text_async, model_name
+from moodle_fixture import start_fixture_server
  
  # 載入 .env 變數
 load_dotenv()
@@ -16,9 +24,22 @@ if not GEMINI_API_KEY:
     print("🔴 無法讀取 GEMINI_API_KEY，請確認 .env 設定。")
 else:
     print("✅ 成功讀取密碼與金鑰")
+
+# Moodle 網址、是否顯示瀏覽器視窗、登入狀態（cookie）的儲存位置，以及每個步驟最多等待的毫秒數
+BASE_URL = os.getenv("MOODLE_BASE_URL", "https://moodle3.ntnu.edu.tw").rstrip("/")
+HEADLESS = os.getenv("MOODLE_HEADLESS", "1") != "0"
+STATE_PATH = os.getenv("MOODLE_STATE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "moodle_state.json"))
+STEP_TIMEOUT_MS = int(os.getenv("MOODLE_TIMEOUT_MS", 15000))
+
+COURSE_NAME = "1132程式語言"
+FORUM_NAME = "公告"
+POST_TITLE = "作業四規定"
+CONTENT_SELECTOR = "div#post-content-643397"
  
  # 將原始內容與 Gemini 回覆合併輸出到 HTML
 def write_full_html(content_html, gemini_reply, output_path="homework.html"):
+    # f-string 的大括號內不能有反斜線，先把換行轉成 <br>
+    reply_html = gemini_reply.replace("\n", "<br>")
     full_html = f"""
     <!DOCTYPE html>
     <html lang="zh-TW">
@@ -43,7 +64,7 @@ def write_full_html(content_html, gemini_reply, output_path="homework.html"):
  
         <div class="section">
             <h2>🤖 Gemini 生成草稿：</h2>
-            <div class="box">{gemini_reply.replace('\n', '<br>')}</div>
+            <div class="box">{reply_html}</div>
         </div>
     </body>
     </html>
@@ -61,77 +82,120 @@ def save_code_as_py(gemini_reply, output_path="generated_code.py"):
         f.write(gemini_reply)
     print(f"✅ 內容已儲存至：{output_path}")
  
- # 主流程：自動抓資料 + 呼叫 Gemini 回答
-async def run():
+async def timed(timings: dict, name: str, awaitable):
+    """等待 awaitable 完成，並把耗時秒數記錄在 timings[name]。"""
+    started = time.perf_counter()
+    result = await awaitable
+    timings[name] = time.perf_counter() - started
+    return result
+
+async def ensure_login(page, base_url, credentials) -> bool:
+    """
+    直接開啟儀表板；已有有效的登入狀態時不必填表單。
+    被導向登入頁（第一次執行或 session 過期）才登入，回傳是否有重新登入。
+    """
+    await page.goto(f"{base_url}/my/", wait_until="domcontentloaded")
+    if "/login/" not in page.url:
+        return False
+    await page.fill("input#username", credentials[0])
+    await page.fill("input#password", credentials[1])
+    await page.click('button[type="submit"].btn.btn-primary')
+    # 登入成功後 Moodle 會導回儀表板；帳密錯誤時停在登入頁，等到逾時才拋出錯誤
+    await page.wait_for_url(lambda url: "/login/" not in url, wait_until="domcontentloaded")
+    return True
+
+async def click_and_wait(page, selector, text, url_pattern):
+    """點擊含有指定文字的元素，並等到網址換成下一頁為止，取代固定秒數的等待。"""
+    await page.locator(selector, has_text=text).first.click()
+    await page.wait_for_url(url_pattern, wait_until="domcontentloaded")
+
+async def scrape_content(base_url=BASE_URL, headless=HEADLESS, state_path=STATE_PATH, credentials=None):
+    """登入 Moodle 並擷取作業說明，回傳 (內容 HTML, 各步驟耗時秒數)。"""
+    credentials = credentials or (username, password)
+    timings = {}
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context()
+        browser = await timed(timings, "啟動瀏覽器", p.chromium.launch(headless=headless))
+        # 沿用上次儲存的 cookie，登入狀態仍有效時可跳過登入表單
+        context = await browser.new_context(storage_state=state_path if os.path.exists(state_path) else None)
+        context.set_default_timeout(STEP_TIMEOUT_MS)
         page = await context.new_page()
- 
-         # 登入 Moodle
-        await page.goto("https://moodle3.ntnu.edu.tw/login/index.php")
-        await page.fill("input#username", username)
-        await page.fill("input#password", password)
-        await page.click('button[type="submit"].btn.btn-primary')
-        await page.wait_for_timeout(3000)
- 
-         # 點擊右上角頭像 -> 儀表板
-        await page.click('a.dropdown-toggle.icon-no-margin')
-        await page.click('a.dropdown-item.menu-action[href*="/my/"]')
-        await page.wait_for_timeout(3000)
- 
-         # 點選課程「1132程式語言」
-        elements = await page.query_selector_all('span.multiline')
-        for element in elements:
-            text = await element.inner_text()
-            if "1132程式語言" in text:
-                await element.click()
-                print("✅ 進入課程：1132程式語言")
-                break
-        await page.wait_for_timeout(3000)
- 
-         # 點選「公告」
-        elements = await page.query_selector_all('span.instancename')
-        for element in elements:
-            text = await element.inner_text()
-            if "公告" in text:
-                await element.click()
-                print("✅ 進入公告區")
-                break
-        await page.wait_for_timeout(3000)
- 
-         # 點選「作業四規定」
-        elements = await page.query_selector_all('a.p-3.p-l-0.w-100.h-100.d-block')
-        for element in elements:
-            text = await element.inner_text()
-            if "作業四規定" in text:
-                await element.click()
-                print("✅ 開啟：作業四規定")
-                break
-        await page.wait_for_timeout(3000)
- 
-         # 擷取內容
-        await page.wait_for_selector('div#post-content-643397', timeout=5000)
-        content_html = await page.inner_html('div#post-content-643397')
- 
+
+        # 登入 Moodle 並進入儀表板
+        logged_in = await timed(timings, "登入／儀表板", ensure_login(page, base_url, credentials))
+        if logged_in:
+            await context.storage_state(path=state_path)
+            print(f"✅ 已登入並儲存登入狀態：{state_path}")
+        else:
+            print("✅ 沿用已儲存的登入狀態")
+
+        # 點選課程「1132程式語言」
+        await timed(timings, "進入課程", click_and_wait(page, "span.multiline", COURSE_NAME, "**/course/view.php*"))
+        print(f"✅ 進入課程：{COURSE_NAME}")
+
+        # 點選「公告」
+        await timed(timings, "進入公告區", click_and_wait(page, "span.instancename", FORUM_NAME, "**/mod/forum/view.php*"))
+        print("✅ 進入公告區")
+
+        # 點選「作業四規定」
+        await timed(timings, "開啟公告", click_and_wait(page, "a.p-3.p-l-0.w-100.h-100.d-block", POST_TITLE, "**/mod/forum/discuss.php*"))
+        print(f"✅ 開啟：{POST_TITLE}")
+
+        # 擷取內容
+        content_html = await timed(timings, "擷取內容", page.locator(CONTENT_SELECTOR).inner_html())
+
         await browser.close()
- 
-         # 使用 Gemini 分析並生成作業草稿
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-2.5-pro-exp-03-25")
-        prompt = f"以下是 Moodle 上老師發布的作業說明，請幫我撰寫符合要求的作業草稿內容，並且要給出完整的程式碼，且要先給完整的程式碼之後再解釋：\n\n{content_html}"
-        response = model.generate_content(prompt)
-        gemini_reply = response.text
- 
-        print("\n📄 Gemini 回覆如下：\n")
-        print(gemini_reply)
- 
-         # 寫入整合版 HTML
-        write_full_html(content_html, gemini_reply)
- 
-         # 儲存程式碼為 .py 檔案
-        save_code_as_py(gemini_reply)
- 
- # 執行
+    return content_html, timings
+
+def print_timings(timings: dict):
+    for name, seconds in timings.items():
+        print(f"  {name}：{seconds:.2f} 秒")
+    print(f"  合計：{sum(timings.values()):.2f} 秒")
+
+# 主流程：自動抓資料 + 呼叫 Gemini 回答
+async def run(headless=HEADLESS):
+    content_html, timings = await scrape_content(headless=headless)
+    print("⏱️ 各步驟耗時：")
+    print_timings(timings)
+
+    # 使用 Gemini 分析並生成作業草稿
+    prompt = f"以下是 Moodle 上老師發布的作業說明，請幫我撰寫符合要求的作業草稿內容，並且要給出完整的程式碼，且要先給完整的程式碼之後再解釋：\n\n{content_html}"
+    gemini_reply = await generate_text_async(prompt, model_name("report"))
+
+    print("\n📄 Gemini 回覆如下：\n")
+    print(gemini_reply)
+
+    # 寫入整合版 HTML
+    write_full_html(content_html, gemini_reply)
+
+    # 儲存程式碼為 .py 檔案
+    save_code_as_py(gemini_reply)
+
+async def benchmark(rounds=3, delay=0.1, headless=True):
+    """
+    對本機的 Moodle 模擬伺服器執行擷取流程（不呼叫 Gemini），印出每一輪各步驟的耗時。
+    第一輪需要登入，之後各輪沿用第一輪儲存的登入狀態。
+    """
+    server, base_url = start_fixture_server(delay=delay)
+    state_path = os.path.join(tempfile.mkdtemp(prefix="moodle_bench_"), "state.json")
+    try:
+        for i in range(rounds):
+            content_html, timings = await scrape_content(base_url, headless, state_path, credentials=("fixture", "fixture"))
+            print(f"第 {i + 1} 輪（擷取 {len(content_html)} 字元）：")
+            print_timings(timings)
+    finally:
+        server.shutdown()
+
+# 執行
 if __name__ == "__main__":
-    asyncio.run(run())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="擷取 Moodle 作業說明並以 Gemini 產生草稿")
+    parser.add_argument("--headed", action="store_true", help="顯示瀏覽器視窗（預設為無頭模式，可用 MOODLE_HEADLESS=0 設定）")
+    parser.add_argument("--benchmark", action="store_true", help="改用本機模擬伺服器量測各步驟耗時")
+    parser.add_argument("--rounds", type=int, default=3, help="量測輪數")
+    parser.add_argument("--delay", type=float, default=0.1, help="模擬伺服器每個頁面的回應延遲秒數")
+    args = parser.parse_args()
+
+    headless = HEADLESS and not args.headed
+    if args.benchmark:
+        asyncio.run(benchmark(args.rounds, args.delay, headless))
+    else:
+        asyncio.run(run(headless))
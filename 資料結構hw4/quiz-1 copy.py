@@ -1,89 +1,30 @@
 import os
 import json
+import re
 import time
 import pandas as pd
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai
-from fpdf import FPDF
-import gradio as gr
-from datetime import datetime
+
+# 共用模組放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import cached_generate
+from gemini_client import generate_text, model_name
+from pdf_renderer import FONT_MISSING_MESSAGE, find_chinese_font, get_pdf_pool
+from rate_limit import TokenBucket
 
 # 加载 .env 文件
 load_dotenv()
 
-def get_chinese_font_file() -> str:
-    """
-    只檢查 Windows 系統字型資料夾中是否存在候選中文字型（TTF 格式）。
-    若找到則回傳完整路徑；否則回傳 None。
-    """
-    fonts_path = r"C:\Windows\Fonts"
-    candidates = ["kaiu.ttf"]  # 這裡以楷體為例，可依需要修改
-    for font in candidates:
-        font_path = os.path.join(fonts_path, font)
-        if os.path.exists(font_path):
-            print("找到系統中文字型：", font_path)
-            return os.path.abspath(font_path)
-    print("未在系統中找到候選中文字型檔案。")
-    return None
-
-def create_table(pdf: FPDF, df: pd.DataFrame):
-    """
-    使用 FPDF 將 DataFrame 以漂亮的表格形式繪製至 PDF，
-    使用交替背景色與標題區塊，並自動處理分頁。
-    """
-    available_width = pdf.w - 2 * pdf.l_margin
-    num_columns = len(df.columns)
-    col_width = available_width / num_columns
-    cell_height = 10
-
-    # 表頭：使用淺灰色背景
-    pdf.set_fill_color(200, 200, 200)
-    pdf.set_font("ChineseFont", "", 12)
-    for col in df.columns:
-        pdf.cell(col_width, cell_height, str(col), border=1, align="C", fill=True)
-    pdf.ln(cell_height)
-
-    # 資料行：交替背景色
-    pdf.set_font("ChineseFont", "", 12)
-    fill = False
-    for index, row in df.iterrows():
-        if pdf.get_y() + cell_height > pdf.h - pdf.b_margin:
-            pdf.add_page()
-            pdf.set_fill_color(200, 200, 200)
-            pdf.set_font("ChineseFont", "", 12)
-            for col in df.columns:
-                pdf.cell(col_width, cell_height, str(col), border=1, align="C", fill=True)
-            pdf.ln(cell_height)
-            pdf.set_font("ChineseFont", "", 12)
-        
-        admission_method = row['單元'] if '單元' in df.columns else ''
-        if admission_method == '比和比值':
-            pdf.set_text_color(0, 0, 255)  # 藍色
-        elif admission_method == '扇形的弧長和面積':
-            pdf.set_text_color(255, 0, 0)  # 紅色
-        elif admission_method == '圓周率和圓面積':
-            pdf.set_text_color(255, 255, 0)  # 黃色
-        elif admission_method == '數量關係':
-            pdf.set_text_color(0, 255, 0)  # 綠色
-        # else:
-        #     pdf.set_text_color(0, 0, 0)  # 默認顏色為黑色
-
-        # 交替背景色設定
-        if fill:
-            pdf.set_fill_color(230, 240, 255)
-        else:
-            pdf.set_fill_color(255, 255, 255)
-        
-        # 輸出每列的資料
-        for item in row:
-            pdf.cell(col_width, cell_height, str(item), border=1, align="C", fill=True)
-        pdf.ln(cell_height)
-        fill = not fill
-
-    # 恢復預設顏色
-    pdf.set_text_color(0, 0, 0)
+MODEL_NAME = model_name("report")
 
+# 每個區塊的筆數、同時分析的區塊數與每分鐘請求上限
+BLOCK_SIZE = 30
+BLOCK_WORKERS = int(os.environ.get("QUIZ1_BLOCK_WORKERS", 4))
+BLOCK_RPM = float(os.environ.get("QUIZ1_RPM", 10))
+# 多個區塊時是否再送一次請求，把各區塊的分析合併成一份報表（QUIZ1_MERGE=0 時改為依序串接）
+MERGE_BLOCKS = os.environ.get("QUIZ1_MERGE", "1") != "0"
 
 def parse_markdown_table(markdown_text: str) -> pd.DataFrame:
     """
@@ -98,15 +39,17 @@ def parse_markdown_table(markdown_text: str) -> pd.DataFrame:
     # 過濾掉空行
     lines = [line.strip() for line in lines if line.strip()]
     # 找到包含 '|' 的行，假設這就是表格
-    table_lines = [line for line in lines if line.startswith("")]
+    table_lines = [line for line in lines if line.startswith("|")]
     if not table_lines:
         return None
-    # 忽略第二行（分隔線）
     header_line = table_lines[0]
-    headers = [h.strip() for h in header_line.strip("").split("")]
+    headers = [h.strip() for h in header_line.strip("|").split("|")]
     data = []
-    for line in table_lines[2:]:
-        row = [cell.strip() for cell in line.strip("").split("")]
+    for line in table_lines[1:]:
+        row = [cell.strip() for cell in line.strip("|").split("|")]
+        # 略過分隔線，以及分區塊分析時每個區塊重複出現的表頭
+        if all(re.fullmatch(r":?-+:?", cell) for cell in row) or row == headers:
+            continue
         if len(row) == len(headers):
             data.append(row)
     df = pd.DataFrame(data, columns=headers)
@@ -114,32 +57,48 @@ def parse_markdown_table(markdown_text: str) -> pd.DataFrame:
 
 def generate_pdf(text: str = None, df: pd.DataFrame = None) -> str:
     print("開始生成 PDF")
-    pdf = FPDF(format="A4")
-    pdf.add_page()
-    
     # 取得中文字型
-    chinese_font_path = get_chinese_font_file()
-    if not chinese_font_path:
-        error_msg = "錯誤：無法取得中文字型檔，請先安裝合適的中文字型！"
+    if not find_chinese_font():
+        error_msg = f"錯誤：{FONT_MISSING_MESSAGE}"
         print(error_msg)
         return error_msg
-    
-    pdf.add_font("ChineseFont", "", chinese_font_path, uni=True)
-    pdf.set_font("ChineseFont", "", 12)
-    
-    if df is not None:
-        create_table(pdf, df)
-    elif text is not None:
-        # 這裡就是你要修改的區塊
-        pdf.multi_cell(0, 10, text)
-    else:
-        pdf.cell(0, 10, "沒有可呈現的內容")
-    
-    pdf_filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    print("輸出 PDF 至檔案：", pdf_filename)
-    pdf.output(pdf_filename)
+
+    # 版面計算在 PDF 行程池中進行，不佔用處理請求的執行緒
+    result = get_pdf_pool().render("report", text=text, df=df)
     print("PDF 生成完成")
-    return pdf_filename
+    return result["path"]
+
+def analyze_block(block: pd.DataFrame, start: int, total_rows: int, user_prompt: str, limiter: TokenBucket) -> str:
+    """分析單一區塊（最多 BLOCK_SIZE 筆），回傳模型的分析結果。"""
+    block_csv = block.to_csv(index=False)
+    prompt = (f"以下是CSV資料第 {start+1} 到 {min(start+BLOCK_SIZE, total_rows)} 筆：\n"
+              f"{block_csv}\n\n請根據以下規則進行分析並產出報表：\n{user_prompt}")
+    print(f"送出區塊 {start//BLOCK_SIZE+1}（第 {start+1} 筆起，prompt 共 {len(prompt)} 字）")
+
+    def call():
+        # 快取命中時不佔用限流額度
+        limiter.acquire()
+        return generate_text(prompt, MODEL_NAME)
+
+    # 使用模型生成内容（同一個 CSV 重新上傳時直接使用快取）
+    return cached_generate(MODEL_NAME, prompt, call).strip()
+
+def merge_block_analyses(block_responses: list, total_rows: int, user_prompt: str, limiter: TokenBucket) -> str:
+    """reduce：把各區塊的分析交給模型彙整成一份完整報表，回傳合併後的內容。"""
+    findings = "\n\n".join(
+        f"【區塊 {n}（第 {(n - 1) * BLOCK_SIZE + 1} 到 {min(n * BLOCK_SIZE, total_rows)} 筆）】\n{block_response}"
+        for n, block_response in enumerate(block_responses, start=1)
+    )
+    prompt = (f"以下是同一份 CSV 資料（共 {total_rows} 筆）分成 {len(block_responses)} 個區塊後各自的分析結果：\n"
+              f"{findings}\n\n請把這些分析合併成一份完整的報表：重複的結論只寫一次、"
+              f"需要跨區塊統計的數字請重新加總，並依照以下規則輸出：\n{user_prompt}")
+    print(f"合併 {len(block_responses)} 個區塊的分析（prompt 共 {len(prompt)} 字）")
+
+    def call():
+        limiter.acquire()
+        return generate_text(prompt, MODEL_NAME)
+
+    return cached_generate(MODEL_NAME, prompt, call).strip()
 
 def gradio_handler(csv_file, user_prompt):
     print("進入 gradio_handler")
@@ -147,32 +106,22 @@ def gradio_handler(csv_file, user_prompt):
         print("讀取 CSV 檔案")
         df = pd.read_csv(csv_file.name)
         total_rows = df.shape[0]
-        block_size = 30
-        cumulative_response = ""
-        block_responses = []
-        
-        # 依區塊處理 CSV 並依每區塊呼叫 LLM 產生報表分析結果
-        for i in range(0, total_rows, block_size):
-            block = df.iloc[i:i+block_size]
-            block_csv = block.to_csv(index=False)
-            prompt = (f"以下是CSV資料第 {i+1} 到 {min(i+block_size, total_rows)} 筆：\n"
-                      f"{block_csv}\n\n請根據以下規則進行分析並產出報表：\n{user_prompt}")
-            print("完整 prompt for block:")
-            print(prompt)
-            
-            # 获取 GEMINI_API_KEY 环境变量
-            gemini_api_key = os.getenv("GEMINI_API_KEY")
-            if not gemini_api_key:
-                raise ValueError("未能加载 GEMINI_API_KEY，请检查 .env 文件中的配置")
-
-            # 初始化 GenerativeModel 时不需要传入 API 密钥
-            model = genai.GenerativeModel('gemini-2.5-pro-exp-03-25')
-
-            # 使用模型生成内容
-            response = model.generate_content(contents=[prompt])
-            block_response = response.text.strip()
-            cumulative_response += f"區塊 {i//block_size+1}:\n{block_response}\n\n"
-            block_responses.append(cumulative_response)
+
+        # map：各區塊互不相依，同時送出分析；reduce：再請模型把各區塊的結論合併成一份報表
+        starts = range(0, total_rows, BLOCK_SIZE)
+        limiter = TokenBucket(BLOCK_RPM)
+        with ThreadPoolExecutor(max_workers=BLOCK_WORKERS) as executor:
+            block_responses = list(executor.map(
+                lambda start: analyze_block(df.iloc[start:start + BLOCK_SIZE], start, total_rows, user_prompt, limiter),
+                starts,
+            ))
+        cumulative_response = "".join(
+            f"區塊 {n}:\n{block_response}\n\n" for n, block_response in enumerate(block_responses, start=1)
+        )
+        if MERGE_BLOCKS and len(block_responses) > 1:
+            # 合併後的報表放在最前面，各區塊的原始分析附在後面方便對照
+            merged = merge_block_analyses(block_responses, total_rows, user_prompt, limiter)
+            cumulative_response = f"合併報表:\n{merged}\n\n各區塊分析:\n\n{cumulative_response}"
 
         # 将所有区块响应合并，并生成漂亮表格 PDF
         pdf_path = generate_pdf(text=cumulative_response)
@@ -182,23 +131,17 @@ def gradio_handler(csv_file, user_prompt):
         full_prompt = f"{context}\n\n{user_prompt}"
         print("完整 prompt：")
         print(full_prompt)
-        
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not gemini_api_key:
-            raise ValueError("未能加载 GEMINI_API_KEY，请检查 .env 文件中的配置")
-
-        # 初始化 GenerativeModel 时不需要传入 API 密钥
-        model = genai.GenerativeModel('gemini-2.5-pro-exp-03-25')
 
-        # 使用模型生成内容
-        response = model.generate_content(contents=[full_prompt])
-        response_text = response.text.strip()
+        # 使用共用的 Gemini 用戶端生成内容（缺少 GEMINI_API_KEY 時會拋出 ValueError）
+        response_text = cached_generate(
+            MODEL_NAME, full_prompt, lambda: generate_text(full_prompt, MODEL_NAME)
+        ).strip()
         print("AI 回應：")
         print(response_text)
 
         # 若輸入的文字包含 Markdown 表格格式，將其解析成 DataFrame 並顯示
-        if " " in response_text:
-            table_part = "\n".join([line for line in response_text.splitlines() if line.strip().startswith("")])
+        if "|" in response_text:
+            table_part = "\n".join([line for line in response_text.splitlines() if line.strip().startswith("|")])
             parsed_df = parse_markdown_table(table_part)
             if parsed_df is not None:
                 print("Markdown 表格解析成功：")
@@ -235,15 +178,27 @@ default_prompt = """請根據"張智翔"同學的答題狀況進行錯誤題目
     會返回包含該資料的 DataFrame。"""
 
 # Gradio UI 设计
-with gr.Blocks() as demo:
-    gr.Markdown("# CSV 報表生成器")
-    with gr.Row():
-        csv_input = gr.File(label="上傳 CSV 檔案")
-        user_input = gr.Textbox(label="請輸入分析指令", lines=10, value=default_prompt)
-    output_text = gr.Textbox(label="回應內容", interactive=False)
-    output_pdf = gr.File(label="下載 PDF 報表")
-    submit_button = gr.Button("生成報表")
-    submit_button.click(fn=gradio_handler, inputs=[csv_input, user_input], outputs=[output_text, output_pdf])
-demo.launch()
+def build_demo():
+    """建立介面；PDF 工作行程以 __mp_main__ 重新匯入本檔時不需要介面，也不載入 gradio。"""
+    import gradio as gr
+
+    with gr.Blocks() as demo:
+        gr.Markdown("# CSV 報表生成器")
+        with gr.Row():
+            csv_input = gr.File(label="上傳 CSV 檔案")
+            user_input = gr.Textbox(label="請輸入分析指令", lines=10, value=default_prompt)
+        output_text = gr.Textbox(label="回應內容", interactive=False)
+        output_pdf = gr.File(label="下載 PDF 報表")
+        submit_button = gr.Button("生成報表")
+        submit_button.click(fn=gradio_handler, inputs=[csv_input, user_input], outputs=[output_text, output_pdf])
+    return demo
+
+if __name__ != "__mp_main__":
+    demo = build_demo()
+
+# PDF 工作行程以 spawn 建立時會重新匯入本檔，不可在子行程中啟動介面
+if __name__ == "__main__":
+    get_pdf_pool().start()
+    demo.launch()
 
 